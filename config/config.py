@@ -20,7 +20,97 @@ DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NA
 # File Paths (absolute paths)
 DATA_RAW_PATH = os.path.join(PROJECT_ROOT, "data", "raw")
 DATA_OUTPUT_PATH = os.path.join(PROJECT_ROOT, "data", "output")
+RATINGS_CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "ratings")
 LOGS_PATH = os.path.join(PROJECT_ROOT, "logs")
 
 # MovieLens Dataset URL
-MOVIELENS_URL = "https://files.grouplens.org/datasets/movielens/ml-32m.zip"
\ No newline at end of file
+MOVIELENS_URL = "https://files.grouplens.org/datasets/movielens/ml-32m.zip"
+ZIP_FILENAME = "ml-32m.zip"
+# Download settings: expected SHA-256 of the archive (None = don't verify, only log it),
+# bytes read per chunk, resume attempts after a dropped connection and socket timeout in seconds
+DOWNLOAD_SHA256 = None
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
+# Parallel Range requests the archive is split into (1 = single stream)
+DOWNLOAD_CONNECTIONS = 1
+# Downloaded chunks stream_ingest.py may buffer ahead of decompression (x DOWNLOAD_CHUNK_SIZE bytes)
+STREAM_BUFFER_CHUNKS = 16
+# Lock that lets one process download while others (e.g. Airflow workers sharing the data
+# directory over NFS) wait: seconds to wait (None = forever), and seconds without a heartbeat
+# after which a lock whose owner died is taken over
+DOWNLOAD_LOCK_TIMEOUT = None
+DOWNLOAD_LOCK_STALE_AFTER = 120
+# Written by download_data.py after every run: {"status": "updated" | "unprocessed" | "unchanged", "sha256": ...}
+DATASET_STATUS_FILE = os.path.join(DATA_RAW_PATH, "dataset_status.json")
+# Written by `download_data.py --mark-processed` once the whole pipeline succeeded: {"sha256": ...}.
+# An unchanged download is only skipped when it is the dataset recorded here.
+PROCESSED_STATUS_FILE = os.path.join(DATA_RAW_PATH, "processed_status.json")
+
+# Extract the archive after downloading. Not needed when LOAD_FROM_ZIP is on,
+# since the loader streams movies.csv and ratings.csv out of the zip itself.
+EXTRACT_ZIP = False
+# Archive members extract_zip writes to disk (None = all of them), and how many
+# are decompressed at once in separate processes
+EXTRACT_MEMBERS = ("ml-32m/movies.csv", "ml-32m/ratings.csv")
+EXTRACT_WORKERS = 2
+# Content-addressed store for the archive and extracted files (None = keep them only in DATA_RAW_PATH).
+# Each run gets hardlinks to its files in RAW_RUNS_PATH/<run id>; the newest RAW_RUNS_KEEP are kept,
+# and stored files none of them (nor DATA_RAW_PATH) uses are deleted.
+RAW_STORE_PATH = os.path.join(PROJECT_ROOT, "data", "store")
+RAW_RUNS_PATH = os.path.join(PROJECT_ROOT, "data", "runs")
+RAW_RUNS_KEEP = 7
+LOAD_FROM_ZIP = True
+
+# Staging load settings
+# LOAD_METHOD: "to_sql" (pandas INSERTs), "copy" (text COPY ... FROM STDIN)
+# or "binary" (PGCOPY binary COPY, numeric tables only; movies fall back to "copy").
+# benchmark_load.py on 5M ratings: binary 240-320k rows/sec, copy 150-190k (see README)
+LOAD_METHOD = "binary"
+LOAD_CHUNKSIZE = 100000
+# Processes loading newline-aligned byte ranges of a CSV concurrently (COPY methods only)
+LOAD_WORKERS = 1
+# STAGING_TABLE_MODE: "logged", "unlogged" (no WAL for staging data) or
+# "freeze" (create + COPY FREEZE in one transaction, serial only).
+# unlogged is no faster on a single disk (within run-to-run noise) but writes no WAL,
+# where logged and freeze write ~31 MB per million ratings
+STAGING_TABLE_MODE = "unlogged"
+# Session settings applied to every loading connection
+LOAD_SESSION_SETTINGS = {
+    "synchronous_commit": "off",
+    "maintenance_work_mem": "1GB",
+}
+# PARSE_ENGINE: CSV parser for staging loads, pandas' "c" or "pyarrow" (needs pyarrow installed),
+# or "numpy" for the memory-mapped ratings.csv parser (other files and zip loads use "c")
+PARSE_ENGINE = "c"
+# Staging tables topped up from their stored watermark when the source file was
+# only appended to (a rewritten file triggers a full reload)
+INCREMENTAL_TABLES = ("staging_ratings",)
+# Bring cleaned_ratings up to date by upserting only the staging ratings past its
+# watermark, instead of rebuilding it from all of staging_ratings (False = always rebuild)
+TRANSFORM_INCREMENTAL = True
+# How transform_data.py keeps the latest rating per (userId, movieId) when rebuilding cleaned_ratings:
+# "distinct_on" (sort), "window" (ROW_NUMBER), "hash_aggregate" (no sort), or "skip_if_unique"
+# (no dedup when the load ledger proves the keys unique, else DEDUP_FALLBACK).
+# benchmark_transform.py on 5M unique ratings: no dedup 3.7-6.1s, distinct_on 5.8-8.2s (see README)
+DEDUP_STRATEGY = "skip_if_unique"
+DEDUP_FALLBACK = "distinct_on"
+# Connections building cleaned_ratings at once: > 1 partitions it by userId range into
+# that many slices built concurrently (same rows as a serial build)
+TRANSFORM_WORKERS = 1
+# Parsed blocks that may wait for COPY while the parser thread works ahead
+# (bounds memory; 0 parses and copies in turn)
+LOAD_QUEUE_DEPTH = 2
+# Adaptive chunk sizing: start at ADAPTIVE_MIN_ROWS and grow/shrink each block
+# from measured rows/sec, keeping every loading process under the memory budget
+ADAPTIVE_CHUNKSIZE = True
+ADAPTIVE_MIN_ROWS = 20000
+ADAPTIVE_MAX_ROWS = 2000000
+LOAD_MEMORY_BUDGET_MB = 2048
+# Write a columnar .npy copy of ratings.csv to RATINGS_CACHE_PATH after loading it
+# (rebuilt only when the source changes), read by quality checks and analytics
+WRITE_RATINGS_CACHE = True
+
+# Data quality: smallest share of the source ratings cleaned_ratings may keep. Cleaning only drops
+# invalid ratings and repeated (userId, movieId) pairs, so losing more than this means the transform broke
+MIN_CLEANED_RATINGS_SHARE = 0.99
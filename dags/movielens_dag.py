@@ -1,7 +1,9 @@
 """
 Airflow DAG for the MovieLens ELT Pipeline.
-Task 7: Schedule daily runs of task 2 to task 6 using Airflow
-Runs daily at 12:00 PM
+Task 7: Schedule daily runs of task 1 to task 6 using Airflow
+Runs daily at 12:00 PM. When the dataset hasn't changed since the last run that
+completed every task, task 1 exits with code 99, which skips it and every
+downstream task for the day.
 """
 
 from datetime import datetime, timedelta
@@ -34,13 +36,14 @@ dag = DAG(
 PROJECT_PATH = '/home/mmesoma/movielens_elt_pipeline'
 VENV_PYTHON = f'{PROJECT_PATH}/venv/bin/python'
 
-# Task 1: Download data (not scheduled daily as data doesn't change)
-# Uncomment if you want to re-download daily
-# download_task = BashOperator(
-#     task_id='download_data',
-#     bash_command=f'{VENV_PYTHON} {PROJECT_PATH}/scripts/download_data.py',
-#     dag=dag,
-# )
+# Task 1: Download data (a conditional request, so an unchanged dataset is
+# never re-downloaded and the rest of the run is skipped)
+download_task = BashOperator(
+    task_id='download_data',
+    bash_command=f'{VENV_PYTHON} {PROJECT_PATH}/scripts/download_data.py --exit-code-if-unchanged 99',
+    skip_on_exit_code=99,
+    dag=dag,
+)
 
 # Task 2: Load data to staging tables
 load_staging_task = BashOperator(
@@ -77,6 +80,15 @@ analytics_task = BashOperator(
     dag=dag,
 )
 
+# Record the dataset as processed only once every task succeeded, so a failed
+# run is retried on the same dataset the next day
+mark_processed_task = BashOperator(
+    task_id='mark_processed',
+    bash_command=f'{VENV_PYTHON} {PROJECT_PATH}/scripts/download_data.py --mark-processed',
+    dag=dag,
+)
+
 # Define task dependencies (order of execution)
-# Task 2 -> Task 3 -> Task 4 -> Task 5 -> Task 6
-load_staging_task >> transform_task >> quality_task >> warehouse_task >> analytics_task
\ No newline at end of file
+# Task 1 -> Task 2 -> Task 3 -> Task 4 -> Task 5 -> Task 6
+download_task >> load_staging_task >> transform_task >> quality_task >> warehouse_task >> analytics_task
+analytics_task >> mark_processed_task
\ No newline at end of file
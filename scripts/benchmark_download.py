@@ -0,0 +1,157 @@
+"""
+Benchmark single-stream against segmented downloads.
+Serves a generated file from a local HTTP server with Range support (or uses
+--url) and downloads it once per connection count, reporting MB/s.
+
+A per-connection bandwidth cap (--stream-mbps) stands in for the per-stream
+limits of real links; without it loopback is fast enough for one stream.
+"""
+
+import os
+import re
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from download_data import download_file
+
+logger = logging.getLogger(__name__)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serve one in-memory payload with ETag, HEAD, conditional GET and single-range GET support."""
+
+    payload = b''
+    etag = '"benchmark"'
+    bytes_per_sec = None  # per connection, None = unthrottled
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_payload_headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.etag)
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(self.payload)}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_payload_headers(200, 0, len(self.payload))
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start, end, status = 0, len(self.payload), 200
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match and self.headers.get('If-Range', self.etag) == self.etag:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1 if match.group(2) else end, end)
+            if start >= end:
+                self.send_response(416)
+                self.end_headers()
+                return
+            status = 206
+        self.send_payload_headers(status, start, end)
+
+        step = 64 * 1024
+        began = time.perf_counter()
+        try:
+            for position in range(start, end, step):
+                self.wfile.write(self.payload[position:min(position + step, end)])
+                if self.bytes_per_sec:
+                    ahead = (position + step - start) / self.bytes_per_sec - (time.perf_counter() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client stopped reading, e.g. after checking the headers
+
+
+def start_server(size_mb, stream_mbps=None):
+    """Start a local server for a random payload of size_mb. Returns (server, url)."""
+    RangeRequestHandler.payload = os.urandom(int(size_mb * 1024 * 1024))
+    RangeRequestHandler.bytes_per_sec = stream_mbps * 1024 * 1024 if stream_mbps else None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    threading.Thread(target=server.serve_forever, name="download-benchmark-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/benchmark.zip"
+
+
+def benchmark_downloads(url, connection_counts, chunk_sizes, destination):
+    """
+    Download url once per connection count and chunk size.
+
+    Returns:
+        List of dicts with connections, chunk_size, mb, seconds and mb_per_sec
+    """
+    results = []
+    for chunk_size in chunk_sizes:
+        for connections in connection_counts:
+            logger.info("-" * 30)
+            logger.info(f"Benchmarking connections={connections} chunk_size={chunk_size:,}")
+            start = time.perf_counter()
+            path = download_file(url, destination, filename="benchmark.zip", expected_sha256=None,
+                                 chunk_size=chunk_size, connections=connections)
+            seconds = time.perf_counter() - start
+            mb = os.path.getsize(path) / (1024*1024)
+            os.remove(path)
+            results.append({
+                'connections': connections,
+                'chunk_size': chunk_size,
+                'mb': mb,
+                'seconds': seconds,
+                'mb_per_sec': mb / seconds if seconds > 0 else 0,
+            })
+    return results
+
+
+def log_results(results):
+    """Log a comparison table, fastest first, relative to the single stream."""
+    logger.info("=" * 50)
+    logger.info("DOWNLOAD BENCHMARK RESULTS")
+    logger.info("=" * 50)
+    single = [r['mb_per_sec'] for r in results if r['connections'] == 1]
+    baseline = max(single) if single else min(r['mb_per_sec'] for r in results) or 1
+    for r in sorted(results, key=lambda r: r['mb_per_sec'], reverse=True):
+        logger.info(f"{r['connections']:>3} connections, {r['chunk_size']:>9,} B chunks: {r['mb']:,.1f} MB "
+                    f"in {r['seconds']:.2f}s = {r['mb_per_sec']:,.1f} MB/s "
+                    f"({r['mb_per_sec'] / baseline:.1f}x single stream)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="Download from this URL instead of the local test server")
+    parser.add_argument('--size-mb', type=float, default=64, help="Size of the local test payload")
+    parser.add_argument('--stream-mbps', type=float, default=10,
+                        help="Per-connection bandwidth cap of the local server in MB/s (0 = none)")
+    parser.add_argument('--connections', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-sizes', nargs='+', type=int, default=[8192, 1024 * 1024])
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_server(args.size_mb, args.stream_mbps or None)
+        logger.info(f"Serving {args.size_mb:,.0f} MB at {url} "
+                    f"({args.stream_mbps or 'unlimited'} MB/s per connection)")
+
+    destination = tempfile.mkdtemp(prefix="download-benchmark-")
+    try:
+        results = benchmark_downloads(url, args.connections, args.chunk_sizes, destination)
+    finally:
+        shutil.rmtree(destination, ignore_errors=True)
+        if server:
+            server.shutdown()
+
+    log_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
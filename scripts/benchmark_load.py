@@ -0,0 +1,194 @@
+"""
+Benchmark the staging load methods against the ratings file.
+Loads the same sample of ratings.csv with each method and reports rows/sec.
+With --parsers, only times parsing the sample with each parse engine (no database).
+
+Note: each run rebuilds staging_ratings, so run load_staging.py afterwards
+if you need the full table back.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+import tempfile
+
+# Add parent directory to path so we can import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import DATA_RAW_PATH
+
+from load_staging import (
+    create_engine_connection, load_csv_to_staging, current_wal_lsn, wal_bytes_since, check_parse_engine,
+    iter_csv_blocks, parse_csv_block, supports_numpy_parser, LOAD_METHODS, STAGING_TABLE_MODES, PARSE_ENGINES
+)
+from ratings_reader import iter_mmap_blocks
+
+logger = logging.getLogger(__name__)
+
+
+def write_sample(csv_path, rows, destination):
+    """
+    Copy the header and first `rows` data lines of a CSV file.
+
+    Args:
+        csv_path: Source CSV file
+        rows: Number of data rows to keep (None keeps the whole file)
+        destination: Path of the sample file to write
+
+    Returns:
+        Path to the sample file
+    """
+    with open(csv_path, 'rb') as src, open(destination, 'wb') as dst:
+        dst.write(src.readline())
+        for i, line in enumerate(src):
+            if rows is not None and i >= rows:
+                break
+            dst.write(line)
+    return destination
+
+
+def benchmark_methods(engine, csv_path, table_name, methods, chunksize, workers=1, table_modes=("logged",)):
+    """
+    Load csv_path once per method and table mode and collect timings.
+
+    WAL is measured server wide, so run on an otherwise idle database.
+
+    Returns:
+        List of dicts with method, table_mode, rows, seconds, rows_per_sec and wal_bytes
+    """
+    results = []
+    for table_mode in table_modes:
+        for method in methods:
+            if method == "to_sql" and table_mode != "logged":
+                continue  # to_sql always writes a logged table
+            logger.info("-" * 30)
+            logger.info(f"Benchmarking method={method} table_mode={table_mode} workers={workers}")
+            with engine.connect() as conn:
+                wal_start = current_wal_lsn(conn.connection.cursor())
+            start = time.perf_counter()
+            # Full loads at a fixed chunk size: an incremental run would append nothing to the
+            # previous method's table, and adaptive sizing would ignore --chunksize
+            rows = load_csv_to_staging(engine, csv_path, table_name, chunksize=chunksize, method=method,
+                                       workers=workers, table_mode=table_mode, incremental=False,
+                                       adaptive=False)
+            seconds = time.perf_counter() - start
+            with engine.connect() as conn:
+                wal_bytes = wal_bytes_since(conn.connection.cursor(), wal_start)
+            results.append({
+                'method': method,
+                'table_mode': table_mode,
+                'rows': rows,
+                'seconds': seconds,
+                'rows_per_sec': rows / seconds if seconds > 0 else 0,
+                'wal_bytes': wal_bytes,
+            })
+    return results
+
+
+def benchmark_parsers(csv_path, table_name, engines, block_bytes):
+    """
+    Parse csv_path block by block with each engine, without loading anything.
+
+    Returns:
+        List of dicts with engine, rows, seconds, rows_per_sec and mb_per_sec
+    """
+    file_size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as f:
+        data_start = len(f.readline())
+    results = []
+    for engine in engines:
+        if engine == "numpy" and not supports_numpy_parser(table_name):
+            logger.info(f"Skipping numpy parser, {table_name} isn't in the ratings layout")
+            continue
+        check_parse_engine(engine)
+        logger.info(f"Benchmarking parse_engine={engine}")
+        rows = 0
+        start = time.perf_counter()
+        with open(csv_path, 'rb') as f:
+            if engine == "numpy":
+                blocks = iter_mmap_blocks(csv_path, data_start, file_size, block_bytes)
+            else:
+                blocks = iter_csv_blocks(f, data_start, file_size, block_bytes)
+            for _, block in blocks:
+                rows += len(parse_csv_block(block, table_name, engine))
+        seconds = time.perf_counter() - start
+        results.append({
+            'engine': engine,
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_sec': rows / seconds if seconds > 0 else 0,
+            'mb_per_sec': (file_size - data_start) / (1024*1024) / seconds if seconds > 0 else 0,
+        })
+    return results
+
+
+def log_parser_results(results):
+    """Log a parse-engine comparison table, fastest first."""
+    logger.info("=" * 50)
+    logger.info("PARSER BENCHMARK RESULTS")
+    logger.info("=" * 50)
+    slowest = min(r['rows_per_sec'] for r in results) or 1
+    for r in sorted(results, key=lambda r: r['rows_per_sec'], reverse=True):
+        logger.info(f"{r['engine']:>8}: {r['rows']:,} rows in {r['seconds']:.2f}s "
+                    f"= {r['rows_per_sec']:,.0f} rows/sec, {r['mb_per_sec']:,.1f} MB/s "
+                    f"({r['rows_per_sec'] / slowest:.1f}x)")
+
+
+def log_results(results):
+    """Log a comparison table, fastest first."""
+    logger.info("=" * 50)
+    logger.info("LOAD BENCHMARK RESULTS")
+    logger.info("=" * 50)
+    slowest = min(r['rows_per_sec'] for r in results) or 1
+    for r in sorted(results, key=lambda r: r['rows_per_sec'], reverse=True):
+        logger.info(f"{r['method']:>8} / {r['table_mode']:<8}: {r['rows']:,} rows in {r['seconds']:.2f}s "
+                    f"= {r['rows_per_sec']:,.0f} rows/sec ({r['rows_per_sec'] / slowest:.1f}x), "
+                    f"WAL {r['wal_bytes'] / (1024*1024):,.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--csv', default=os.path.join(DATA_RAW_PATH, "ml-32m", "ratings.csv"))
+    parser.add_argument('--table', default="staging_ratings")
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help="Sample size in rows (0 = whole file)")
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--methods', nargs='+', default=list(LOAD_METHODS), choices=LOAD_METHODS)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Parallel byte-range workers for the COPY methods")
+    parser.add_argument('--table-modes', nargs='+', default=["logged"], choices=STAGING_TABLE_MODES)
+    parser.add_argument('--parsers', nargs='+', choices=PARSE_ENGINES,
+                        help="Only benchmark these parse engines, without touching the database")
+    parser.add_argument('--block-mb', type=float, default=4,
+                        help="Block size in MB for --parsers")
+    args = parser.parse_args()
+
+    if args.parsers:
+        block_bytes = int(args.block_mb * 1024 * 1024)
+        if args.rows:
+            with tempfile.TemporaryDirectory() as tmp:
+                sample = write_sample(args.csv, args.rows, os.path.join(tmp, os.path.basename(args.csv)))
+                results = benchmark_parsers(sample, args.table, args.parsers, block_bytes)
+        else:
+            results = benchmark_parsers(args.csv, args.table, args.parsers, block_bytes)
+        log_parser_results(results)
+        return results
+
+    engine = create_engine_connection()
+
+    if args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            sample = write_sample(args.csv, args.rows, os.path.join(tmp, os.path.basename(args.csv)))
+            results = benchmark_methods(engine, sample, args.table, args.methods, args.chunksize,
+                                        args.workers, args.table_modes)
+    else:
+        results = benchmark_methods(engine, args.csv, args.table, args.methods, args.chunksize,
+                                    args.workers, args.table_modes)
+
+    log_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
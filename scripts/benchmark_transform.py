@@ -0,0 +1,312 @@
+"""
+Benchmark the dedup strategies of transform_data.py against staging_ratings.
+Runs each strategy's CREATE TABLE AS under EXPLAIN (ANALYZE, BUFFERS) into a
+scratch table that is rolled back, and reports the time, the bytes written to
+temp files (sorts and hashes that spilled out of work_mem) and a fingerprint of
+the result, so the strategies can be checked to agree.
+
+Leaves cleaned_ratings untouched. "none" doesn't deduplicate, so it only
+matches the others when staging_ratings has no duplicate keys.
+
+With --profile-build, compares the two ways of building cleaned_ratings and
+profiling staging_ratings when the load ledger doesn't cover it: the single
+statement transform_data.py runs (staging rows read once into a materialized
+CTE), and a CREATE TABLE AS followed by one statement that profiles
+staging_ratings and counts its duplicate pairs.
+
+With --titles, compares movie_titles.parse_titles() with the SQL that parses
+release_year and clean_title out of staging_movies instead: the time each
+takes, and every title where their results differ.
+"""
+
+import json
+import time
+import argparse
+import logging
+
+import pandas as pd
+from sqlalchemy import text
+
+from movie_titles import parse_titles
+from transform_data import (
+    create_engine_connection, dedup_ratings_sql, build_ratings_sql, staging_titles_parsed, DEDUP_STRATEGIES,
+    VALID_RATING, RATINGS_PROFILE, DUPLICATE_PAIRS, RELEASE_YEAR_SQL, CLEAN_TITLE_SQL
+)
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_TABLE = "dedup_benchmark"
+# Plan nodes that show how a strategy deduplicates
+DEDUP_NODES = ('Sort', 'Incremental Sort', 'Aggregate', 'WindowAgg', 'Unique')
+
+
+def _plan_nodes(plan):
+    """Yield a plan node and all its descendants."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def describe_plan(plan):
+    """Comma separated sort/aggregate nodes of a plan, e.g. "Hashed Aggregate"."""
+    names = [f"{node['Strategy']} {node['Node Type']}" if 'Strategy' in node else node['Node Type']
+             for node in _plan_nodes(plan) if node['Node Type'] in DEDUP_NODES]
+    return ", ".join(dict.fromkeys(names))
+
+
+def benchmark_strategies(engine, strategies, where=VALID_RATING, work_mem=None):
+    """
+    Build the deduplicated ratings once per strategy, inside a transaction that is rolled back.
+
+    Returns:
+        List of dicts with strategy, rows, seconds, temp_bytes, plan (node types) and checksum
+    """
+    results = []
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW block_size")
+            block_size = int(cursor.fetchone()[0])
+        connection.rollback()
+
+        for strategy in strategies:
+            logger.info("-" * 30)
+            logger.info(f"Benchmarking dedup strategy={strategy}")
+            settings = DEDUP_STRATEGIES[strategy][1]
+            try:
+                with connection.cursor() as cursor:
+                    if work_mem:
+                        cursor.execute("SELECT set_config('work_mem', %s, true)", (work_mem,))
+                    for name, value in settings.items():
+                        cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+                    start = time.perf_counter()
+                    cursor.execute(f"""
+                        EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+                        CREATE TABLE {SCRATCH_TABLE} AS {dedup_ratings_sql(strategy, where)}
+                    """)
+                    seconds = time.perf_counter() - start
+                    explain = cursor.fetchone()[0]
+                    if isinstance(explain, str):
+                        explain = json.loads(explain)
+                    plan = explain[0]['Plan']
+
+                    cursor.execute(f"""
+                        SELECT COUNT(*), COALESCE(SUM(rating_timestamp), 0),
+                               COALESCE(SUM(hashtext(
+                                   "userId"::text || ':' || "movieId"::text || ':' || rating::text
+                               )::bigint), 0)
+                        FROM {SCRATCH_TABLE}
+                    """)
+                    rows, timestamp_sum, row_hash = cursor.fetchone()
+            finally:
+                connection.rollback()
+
+            results.append({
+                'strategy': strategy,
+                'rows': rows,
+                'seconds': seconds,
+                'temp_bytes': plan.get('Temp Written Blocks', 0) * block_size,
+                'plan': describe_plan(plan),
+                'checksum': (rows, timestamp_sum, row_hash),
+            })
+            logger.info(f"{strategy}: {rows:,} rows in {seconds:.2f}s, "
+                        f"temp {results[-1]['temp_bytes'] / (1024*1024):,.1f} MB")
+    finally:
+        connection.close()
+    return results
+
+
+def log_results(results):
+    """Log a comparison table, fastest first, and whether each strategy agrees with the first one."""
+    logger.info("=" * 50)
+    logger.info("DEDUP BENCHMARK RESULTS")
+    logger.info("=" * 50)
+    slowest = max(r['seconds'] for r in results) or 1
+    reference = results[0]
+    for r in sorted(results, key=lambda r: r['seconds']):
+        agrees = "same result" if r['checksum'] == reference['checksum'] else \
+            f"DIFFERENT result from {reference['strategy']}"
+        logger.info(f"{r['strategy']:>15}: {r['rows']:,} rows in {r['seconds']:.2f}s "
+                    f"({slowest / r['seconds'] if r['seconds'] > 0 else 0:.1f}x), "
+                    f"temp {r['temp_bytes'] / (1024*1024):,.1f} MB, {r['plan'] or 'scan only'} - {agrees}")
+
+
+def benchmark_profile_build(engine, strategy, work_mem=None):
+    """
+    Build and profile the ratings both ways (see the module docstring), each in a transaction that is rolled back.
+
+    Returns:
+        List of dicts with method, seconds and temp_bytes (both summed over the method's statements)
+    """
+    methods = {
+        "one statement, materialized CTE": [
+            f"CREATE TABLE {SCRATCH_TABLE} AS {dedup_ratings_sql(strategy)} WITH NO DATA",
+            build_ratings_sql(SCRATCH_TABLE, strategy),
+        ],
+        "CREATE TABLE AS, then profile": [
+            f"CREATE TABLE {SCRATCH_TABLE} AS {dedup_ratings_sql(strategy)}",
+            f"""SELECT ({DUPLICATE_PAIRS.format(source="staging_ratings")}) as duplicate_pairs, profile.*
+                FROM (SELECT {RATINGS_PROFILE} FROM staging_ratings) profile""",
+        ],
+    }
+    results = []
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW block_size")
+            block_size = int(cursor.fetchone()[0])
+        connection.rollback()
+
+        for method, statements in methods.items():
+            logger.info("-" * 30)
+            logger.info(f"Benchmarking {method} (strategy={strategy})")
+            seconds, temp_bytes = 0.0, 0
+            try:
+                with connection.cursor() as cursor:
+                    if work_mem:
+                        cursor.execute("SELECT set_config('work_mem', %s, true)", (work_mem,))
+                    for name, value in DEDUP_STRATEGIES[strategy][1].items():
+                        cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+                    for statement in statements:
+                        if statement.rstrip().endswith("WITH NO DATA"):
+                            cursor.execute(statement)
+                            continue
+                        start = time.perf_counter()
+                        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}")
+                        seconds += time.perf_counter() - start
+                        explain = cursor.fetchone()[0]
+                        if isinstance(explain, str):
+                            explain = json.loads(explain)
+                        temp_bytes += explain[0]['Plan'].get('Temp Written Blocks', 0) * block_size
+            finally:
+                connection.rollback()
+            results.append({'method': method, 'seconds': seconds, 'temp_bytes': temp_bytes})
+            logger.info(f"{method}: {seconds:.2f}s, temp {temp_bytes / (1024*1024):,.1f} MB")
+    finally:
+        connection.close()
+    return results
+
+
+def _differs(left, right):
+    """Mask of the positions where two Series differ, counting NULL as equal to NULL only."""
+    both_null = left.isna() & right.isna()
+    return ~(both_null | (left == right).fillna(False).astype(bool))
+
+
+def _execution_seconds(connection, query):
+    """Server side execution time of a query, from EXPLAIN ANALYZE."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}")
+        explain = cursor.fetchone()[0]
+    connection.rollback()
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+    return explain[0]['Execution Time'] / 1000
+
+
+def benchmark_titles(engine):
+    """
+    Parse every title of staging_movies with parse_titles() and with the SQL, and compare.
+
+    Returns:
+        Dict with rows, python_seconds, sql_seconds, scan_seconds (the same query without
+        the title expressions), mismatches (titles parsed differently, as a DataFrame)
+        and stored_mismatches (rows whose load-time columns differ from the SQL, None if
+        staging_movies doesn't have them)
+    """
+    with engine.connect() as conn:
+        sql = pd.read_sql(text(f"""
+            SELECT title, {RELEASE_YEAR_SQL} as release_year, {CLEAN_TITLE_SQL} as clean_title
+            FROM staging_movies
+        """), conn)
+        stored_mismatches = None
+        if staging_titles_parsed(conn):
+            stored_mismatches = conn.execute(text(f"""
+                SELECT COUNT(*) FROM staging_movies
+                WHERE release_year IS DISTINCT FROM ({RELEASE_YEAR_SQL})
+                   OR clean_title IS DISTINCT FROM ({CLEAN_TITLE_SQL})
+            """)).scalar()
+
+    start = time.perf_counter()
+    parsed = parse_titles(sql['title'])
+    python_seconds = time.perf_counter() - start
+
+    connection = engine.raw_connection()
+    try:
+        sql_seconds = _execution_seconds(
+            connection, f"SELECT {RELEASE_YEAR_SQL}, {CLEAN_TITLE_SQL} FROM staging_movies")
+        scan_seconds = _execution_seconds(connection, "SELECT title FROM staging_movies")
+    finally:
+        connection.close()
+
+    differs = (_differs(parsed['release_year'], sql['release_year'].astype('Int32'))
+               | _differs(parsed['clean_title'], sql['clean_title'].astype('string')))
+    mismatches = sql[differs].join(parsed[differs], rsuffix='_python')
+    return {
+        'rows': len(sql),
+        'python_seconds': python_seconds,
+        'sql_seconds': sql_seconds,
+        'scan_seconds': scan_seconds,
+        'mismatches': mismatches,
+        'stored_mismatches': stored_mismatches,
+    }
+
+
+def log_title_results(result):
+    """Log the timings of a title benchmark and any title the two parsers disagree on."""
+    logger.info("=" * 50)
+    logger.info("TITLE PARSING BENCHMARK RESULTS")
+    logger.info("=" * 50)
+    logger.info(f"{result['rows']:,} titles")
+    logger.info(f"    pandas: {result['python_seconds']:.3f}s (parse_titles)")
+    logger.info(f"       SQL: {result['sql_seconds']:.3f}s "
+                f"({result['sql_seconds'] - result['scan_seconds']:.3f}s more than scanning the titles)")
+    mismatches = result['mismatches']
+    if mismatches.empty:
+        logger.info("pandas and SQL agree on every title")
+    else:
+        logger.error(f"pandas and SQL disagree on {len(mismatches):,} titles:")
+        for row in mismatches.head(20).itertuples(index=False):
+            logger.error(f"    {row.title!r}: SQL ({row.release_year}, {row.clean_title!r}), "
+                         f"pandas ({row.release_year_python}, {row.clean_title_python!r})")
+    if result['stored_mismatches'] is None:
+        logger.info("staging_movies has no load-time release_year/clean_title, reload it to add them")
+    elif result['stored_mismatches']:
+        logger.error(f"{result['stored_mismatches']:,} rows of staging_movies were parsed differently at load time")
+    else:
+        logger.info("The release_year and clean_title stored at load time match the SQL on every row")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--strategies', nargs='+', default=list(DEDUP_STRATEGIES), choices=list(DEDUP_STRATEGIES))
+    parser.add_argument('--work-mem', help="work_mem for each run, e.g. 64MB (default: the server's)")
+    parser.add_argument('--max-user', type=int,
+                        help="Only use the ratings of users up to this id (smaller sample)")
+    parser.add_argument('--titles', action='store_true',
+                        help="Benchmark parsing movie titles in pandas against SQL instead")
+    parser.add_argument('--profile-build', action='store_true',
+                        help="Benchmark building and profiling cleaned_ratings in one statement against two, "
+                             "with the first of --strategies")
+    args = parser.parse_args()
+
+    if args.profile_build:
+        return benchmark_profile_build(create_engine_connection(), args.strategies[0], args.work_mem)
+
+    if args.titles:
+        result = benchmark_titles(create_engine_connection())
+        log_title_results(result)
+        return result
+
+    where = VALID_RATING
+    if args.max_user:
+        where = f'"userId" <= {args.max_user} AND {where}'
+
+    engine = create_engine_connection()
+    results = benchmark_strategies(engine, args.strategies, where, args.work_mem)
+    log_results(results)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ from datetime import datetime
 # Add parent directory to path so we can import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.config import DATABASE_URL, LOGS_PATH
+from progress import ProgressReporter
 
 # Setup logging
 logging.basicConfig(
@@ -276,25 +277,33 @@ def main():
     start_time = datetime.now()
     
     engine = create_engine_connection()
+    progress = ProgressReporter(7, label="Task 5", unit="steps")
     
     logger.info("-" * 30)
     logger.info("Creating Dimension Tables...")
     create_dim_movies(engine)
+    progress.advance(detail="dim_movies")
     create_dim_genres(engine)
+    progress.advance(detail="dim_genres")
     create_dim_users(engine)
+    progress.advance(detail="dim_users")
     
     logger.info("-" * 30)
     logger.info("Creating Bridge Table...")
     create_bridge_movie_genres(engine)
+    progress.advance(detail="bridge_movie_genres")
     
     logger.info("-" * 30)
     logger.info("Creating Fact Table...")
     create_fact_ratings(engine)
+    progress.advance(detail="fact_ratings")
     
     logger.info("-" * 30)
     create_indexes(engine)
+    progress.advance(detail="indexes")
     
     verify_warehouse(engine)
+    progress.advance(detail="verified")
     
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
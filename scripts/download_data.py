@@ -5,14 +5,30 @@ Task 1: Download the ml-32m.zip file
 
 import os
 import sys
+import re
+import json
+import time
+import argparse
+import shutil
+import hashlib
+import threading
 import requests
 import zipfile
 import logging
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # Add parent directory to path so we can import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config.config import MOVIELENS_URL, ZIP_FILENAME, DATA_RAW_PATH, LOGS_PATH
+from config.config import (
+    MOVIELENS_URL, ZIP_FILENAME, DATA_RAW_PATH, LOGS_PATH, EXTRACT_ZIP,
+    DOWNLOAD_SHA256, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_RETRIES, DOWNLOAD_TIMEOUT, DOWNLOAD_CONNECTIONS,
+    DATASET_STATUS_FILE, PROCESSED_STATUS_FILE, EXTRACT_MEMBERS, EXTRACT_WORKERS, RAW_STORE_PATH, RAW_RUNS_PATH, RAW_RUNS_KEEP,
+    DOWNLOAD_LOCK_TIMEOUT, DOWNLOAD_LOCK_STALE_AFTER
+)
+from progress import ProgressReporter
+from raw_store import RawStore
+from file_lock import FileLock, LockLost
 
 # Setup logging
 os.makedirs(LOGS_PATH, exist_ok=True)
@@ -26,14 +42,79 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+HASH_BUFFER_BYTES = 8 * 1024 * 1024
+EXTRACT_BUFFER_BYTES = 1024 * 1024
+
+
+def read_sidecar(path):
+    """
+    Return the metadata saved next to a download in `<path>.json`, or {} if there is none.
+    
+    A partial download's sidecar holds the validators needed to resume it, a
+    finished one's the validators and checksum of the last fetch.
+    """
+    try:
+        with open(f"{path}.json") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_sidecar(path, meta):
+    """Save metadata next to a (partial) download."""
+    with open(f"{path}.json", 'w') as f:
+        json.dump(meta, f)
+
+
+def discard_part(part_path):
+    """Remove a partial download and its validators."""
+    for path in (part_path, f"{part_path}.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def hash_file(path, digest=None, limit=None):
+    """Feed the first `limit` bytes of a file (all of it by default) into a hashlib digest."""
+    digest = digest or hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            buffer = f.read(HASH_BUFFER_BYTES if remaining is None else min(HASH_BUFFER_BYTES, remaining))
+            if not buffer:
+                break
+            digest.update(buffer)
+            if remaining is not None:
+                remaining -= len(buffer)
+    return digest
+
 
-def download_file(url, destination):
+def download_file(url, destination, filename=ZIP_FILENAME, expected_sha256=DOWNLOAD_SHA256,
+                  chunk_size=DOWNLOAD_CHUNK_SIZE, retries=DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT,
+                  connections=DOWNLOAD_CONNECTIONS, lost=None):
     """
     Download a file from a URL to a destination folder.
     
+    Bytes are written to `<filename>.part` and only renamed to the final name once
+    the download is complete and its checksum verified, so the final file is never
+    truncated. An interrupted download resumes with an HTTP Range request from the
+    end of the partial file, both on retry and in a later run. If-Range makes the
+    server send the whole file instead if it changed in the meantime.
+    
+    With connections > 1 the file is fetched as that many byte ranges in parallel
+    (see download_segmented), falling back to one stream if the server doesn't
+    support Range requests.
+    
     Args:
         url: The URL to download from
         destination: The folder to save the file to
+        filename: Name of the downloaded file
+        expected_sha256: Hex SHA-256 the file must have (None to only log it)
+        chunk_size: Bytes read from the response at a time
+        retries: Attempts to resume after a dropped connection before giving up
+        timeout: Seconds to wait for the server to connect or send data
+        connections: Number of parallel Range requests (1 = single stream)
+        lost: Optional threading.Event (FileLock.lost) that, once set, stops the
+            download before it writes any more of the partial file or renames it
     
     Returns:
         Path to the downloaded file
@@ -44,28 +125,38 @@ def download_file(url, destination):
         # Create destination folder if it doesn't exist
         os.makedirs(destination, exist_ok=True)
         
-        # Get the filename from URL
-        filename = os.path.join(destination, ZIP_FILENAME)
+        filename = os.path.join(destination, filename)
+        part_path = f"{filename}.part"
         
-        # Download with progress
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise error if download failed
+        result = None
+        if connections > 1:
+            result = download_segmented(url, part_path, connections, chunk_size, retries, timeout, lost)
+        if result is None:
+            result = download_stream(url, part_path, chunk_size, retries, timeout, lost)
+        digest, downloaded, total_size = result
         
-        total_size = int(response.headers.get('content-length', 0))
-        logger.info(f"File size: {total_size / (1024*1024):.2f} MB")
+        if total_size and downloaded != total_size:
+            raise IOError(f"Download incomplete: got {downloaded:,} of {total_size:,} bytes")
+        checksum = digest.hexdigest()
+        if expected_sha256 and checksum != expected_sha256.lower():
+            discard_part(part_path)
+            raise ValueError(f"Checksum mismatch for {url}: expected {expected_sha256}, got {checksum}")
+        logger.info(f"SHA-256: {checksum}")
         
-        # Write file in chunks
-        with open(filename, 'wb') as f:
-            downloaded = 0
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    # Log progress every 10%
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        if downloaded % (total_size // 10) < 8192:
-                            logger.info(f"Downloaded: {percent:.1f}%")
+        # Atomically replace any previous copy, then record what was fetched
+        # so the next run can ask the server whether it changed
+        check_lost(lost)
+        meta = read_sidecar(part_path)
+        os.replace(part_path, filename)
+        write_sidecar(filename, {
+            'url': url,
+            'etag': meta.get('etag'),
+            'last_modified': meta.get('last_modified'),
+            'size': downloaded,
+            'sha256': checksum,
+            'downloaded_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        os.remove(f"{part_path}.json")
         
         logger.info(f"Download complete: {filename}")
         return filename
@@ -75,57 +166,559 @@ def download_file(url, destination):
         raise
 
 
-def extract_zip(zip_path, destination):
+def is_unchanged(url, path, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Ask the server with a conditional GET whether the file at `path` is still current.
+    
+    Sends If-None-Match / If-Modified-Since from the last fetch's metadata. A 304
+    means unchanged; servers that ignore the conditions and answer 200 are compared
+    on ETag, or on Last-Modified and size. The body is never read.
+    
+    Returns:
+        True if `path` exists, is complete and the server's copy hasn't changed
+    """
+    meta = read_sidecar(path)
+    if not os.path.exists(path) or meta.get('url') != url or os.path.getsize(path) != meta.get('size'):
+        return False
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    if not headers:
+        return False
+    
+    with requests.get(url, stream=True, headers=headers, timeout=timeout) as response:
+        if response.status_code == 304:
+            logger.info(f"Server reports {url} not modified (304)")
+            return True
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        if etag:
+            unchanged = etag == meta.get('etag')
+        else:
+            unchanged = (response.headers.get('Last-Modified') == meta.get('last_modified')
+                         and int(response.headers.get('content-length', -1)) == meta['size'])
+    if unchanged:
+        logger.info(f"Server metadata for {url} matches the last download")
+    return unchanged
+
+
+def write_dataset_status(status, zip_path, status_file=DATASET_STATUS_FILE, run_dir=None):
+    """
+    Record whether this run found a new dataset ("updated"), the same dataset as the
+    last download but one no run has finished processing ("unprocessed"), or nothing
+    to do ("unchanged").
+    
+    Downstream stages read DATASET_STATUS_FILE to decide whether to skip work.
+    """
+    meta = read_sidecar(zip_path)
+    os.makedirs(os.path.dirname(status_file), exist_ok=True)
+    with open(status_file, 'w') as f:
+        json.dump({
+            'status': status,
+            'path': zip_path,
+            'sha256': meta.get('sha256'),
+            'etag': meta.get('etag'),
+            'downloaded_at': meta.get('downloaded_at'),
+            'run_dir': run_dir,
+            'checked_at': datetime.now().isoformat(timespec='seconds'),
+        }, f, indent=2)
+    logger.info(f"Dataset status: {status} (written to {status_file})")
+
+
+def read_processed_sha256(processed_file=PROCESSED_STATUS_FILE):
+    """Return the SHA-256 of the dataset the last successful pipeline run processed, or None."""
+    try:
+        with open(processed_file) as f:
+            return json.load(f).get('sha256')
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def mark_processed(status_file=DATASET_STATUS_FILE, processed_file=PROCESSED_STATUS_FILE):
+    """
+    Record that the pipeline finished processing the dataset of this run's download step.
+    
+    Run as the last task of the pipeline, so that a failure anywhere after the
+    download makes the next run process the same archive again.
+    """
+    with open(status_file) as f:
+        status = json.load(f)
+    os.makedirs(os.path.dirname(processed_file), exist_ok=True)
+    with open(f"{processed_file}.tmp", 'w') as f:
+        json.dump({
+            'sha256': status.get('sha256'),
+            'path': status.get('path'),
+            'processed_at': datetime.now().isoformat(timespec='seconds'),
+        }, f, indent=2)
+    os.replace(f"{processed_file}.tmp", processed_file)
+    logger.info(f"Marked dataset {(status.get('sha256') or '?')[:12]} as processed (written to {processed_file})")
+
+
+def check_lost(lost):
+    """Stop a download whose lock was taken over: the new owner writes the same partial file."""
+    if lost is not None and lost.is_set():
+        raise LockLost("The download lock was taken over by another process, stopping this download")
+
+
+def download_stream(url, part_path, chunk_size, retries, timeout, lost=None):
+    """
+    Download url into part_path over one connection, resuming a previous partial file.
+    
+    Returns:
+        (sha256 digest, bytes downloaded, total size or 0 if unknown)
+    """
+    meta = read_sidecar(part_path)
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        # A segmented partial file is preallocated, so its size says nothing about progress
+        if (offset and meta.get('url') == url and 'segments' not in meta
+                and (meta.get('etag') or meta.get('last_modified'))):
+            headers['Range'] = f"bytes={offset}-"
+            headers['If-Range'] = meta.get('etag') or meta['last_modified']
+        else:
+            offset = 0
+        if offset and offset == meta.get('total_size'):
+            logger.info("Partial download is already complete, verifying it")
+            return hash_file(part_path), offset, offset
+        
+        try:
+            with requests.get(url, stream=True, headers=headers, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # Our partial file is longer than the resource, start over
+                    logger.warning(f"Server rejected resume at byte {offset:,}, restarting download")
+                    discard_part(part_path)
+                    meta = {}
+                    continue
+                response.raise_for_status()  # Raise error if download failed
+                
+                resumed = response.status_code == 206
+                if offset and not resumed:
+                    logger.info("Server sent the whole file (resource changed or no Range support), "
+                                "restarting from byte 0")
+                    offset = 0
+                total_size = offset + int(response.headers.get('content-length', 0))
+                meta = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'total_size': total_size,
+                }
+                write_sidecar(part_path, meta)
+                if resumed:
+                    logger.info(f"Resuming at byte {offset:,} of {total_size:,}")
+                    digest = hash_file(part_path, limit=offset)
+                else:
+                    digest = hashlib.sha256()
+                logger.info(f"File size: {total_size / (1024*1024):.2f} MB")
+                
+                # Write file in chunks, hashing as we go
+                progress = ProgressReporter(total_size, label="Download", min_interval=5, start=offset)
+                with open(part_path, 'r+b' if resumed else 'wb') as f:
+                    f.seek(offset)
+                    f.truncate()
+                    downloaded = offset
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        check_lost(lost)
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            downloaded += len(chunk)
+                            progress.update(downloaded)
+                    f.flush()
+                    os.fsync(f.fileno())
+            return digest, downloaded, meta['total_size']
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"Download interrupted ({e}), resuming (attempt {attempt + 2}/{retries + 1})")
+            time.sleep(min(2 ** attempt, 30))
+    raise IOError(f"Download of {url} did not complete after {retries + 1} attempts")
+
+
+def split_segments(total_size, connections):
+    """Split [0, total_size) into `connections` contiguous [start, end) byte ranges."""
+    count = max(1, min(connections, total_size))
+    bounds = [total_size * i // count for i in range(count + 1)]
+    return [[start, end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def download_segmented(url, part_path, connections, chunk_size, retries, timeout, lost=None):
+    """
+    Download url into a preallocated part_path as `connections` byte ranges fetched in parallel.
+    
+    Each range is written in place with os.pwrite, and the bytes done per range are
+    kept in the part metadata so a later run only fetches what is missing. Ranges
+    arrive out of order, so the checksum is computed from the finished file.
+    
+    Returns:
+        (sha256 digest, bytes downloaded, total size), or None if the server
+        doesn't report a size or support Range requests
+    """
+    head = requests.head(url, allow_redirects=True, timeout=timeout)
+    head.raise_for_status()
+    total_size = int(head.headers.get('content-length', 0))
+    validator = head.headers.get('ETag') or head.headers.get('Last-Modified')
+    if head.headers.get('Accept-Ranges', '').lower() != 'bytes' or not total_size:
+        logger.info("Server doesn't advertise Range support and a size, using a single stream")
+        return None
+    
+    meta = read_sidecar(part_path)
+    if (meta.get('url') == url and meta.get('total_size') == total_size and meta.get('segments')
+            and validator and validator in (meta.get('etag'), meta.get('last_modified'))
+            and os.path.exists(part_path) and os.path.getsize(part_path) == total_size):
+        segments = meta['segments']
+        logger.info(f"Resuming segmented download, {sum(done - start for start, _, done in segments):,} "
+                    f"of {total_size:,} bytes already fetched")
+    else:
+        discard_part(part_path)
+        with open(part_path, 'wb') as f:
+            f.truncate(total_size)
+        segments = [[start, end, start] for start, end in split_segments(total_size, connections)]
+    meta = {
+        'url': url,
+        'etag': head.headers.get('ETag'),
+        'last_modified': head.headers.get('Last-Modified'),
+        'total_size': total_size,
+        'segments': segments,
+    }
+    write_sidecar(part_path, meta)
+    logger.info(f"File size: {total_size / (1024*1024):.2f} MB, "
+                f"fetching {len(segments)} ranges over {connections} connections")
+    
+    lock = threading.Lock()
+    stop = threading.Event()
+    last_save = [time.monotonic()]
+    progress = ProgressReporter(total_size, label="Download", min_interval=5,
+                                start=sum(done - start for start, _, done in segments))
+    
+    def fetch(segment):
+        start, end, _ = segment
+        for attempt in range(retries + 1):
+            if segment[2] >= end or stop.is_set():
+                return
+            headers = {'Range': f"bytes={segment[2]}-{end - 1}"}
+            if validator:
+                headers['If-Range'] = validator
+            try:
+                with requests.get(url, stream=True, headers=headers, timeout=timeout) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise IOError(f"{url} changed during the download (got {response.status_code} "
+                                      f"for a Range request)")
+                    fd = os.open(part_path, os.O_WRONLY)
+                    try:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if stop.is_set():
+                                return
+                            check_lost(lost)
+                            chunk = chunk[:end - segment[2]]
+                            os.pwrite(fd, chunk, segment[2])
+                            with lock:
+                                segment[2] += len(chunk)
+                                progress.update(progress.done + len(chunk))
+                                if time.monotonic() - last_save[0] >= 1:
+                                    write_sidecar(part_path, meta)
+                                    last_save[0] = time.monotonic()
+                            if segment[2] >= end:
+                                break
+                    finally:
+                        os.close(fd)
+                with lock:
+                    write_sidecar(part_path, meta)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                with lock:
+                    write_sidecar(part_path, meta)
+                if attempt == retries:
+                    raise
+                logger.warning(f"Range {start:,}-{end:,} interrupted ({e}), resuming at {segment[2]:,} "
+                               f"(attempt {attempt + 2}/{retries + 1})")
+                time.sleep(min(2 ** attempt, 30))
+        if segment[2] < end:
+            raise IOError(f"Range {start:,}-{end:,} of {url} did not complete after {retries + 1} attempts")
+    
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        futures = [pool.submit(fetch, segment) for segment in segments]
+        try:
+            for future in as_completed(futures):
+                future.result()
+        except BaseException:
+            stop.set()
+            raise
+    
+    with open(part_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    downloaded = sum(done - start for start, _, done in segments)
+    return hash_file(part_path), downloaded, total_size
+
+
+def extract_member(zip_path, name, destination):
+    """
+    Extract one archive member, writing to a temporary name and renaming when complete.
+    
+    Runs in a worker process, so it opens its own handle on the archive. The
+    SHA-256 of the member is computed while it is written.
+    
+    Returns:
+        (member name, uncompressed bytes, seconds taken, sha256 hex)
+    """
+    start = time.perf_counter()
+    target = os.path.join(destination, *name.split('/'))
+    if not os.path.abspath(target).startswith(os.path.abspath(destination) + os.sep):
+        raise ValueError(f"Refusing to extract {name} outside {destination}")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with zip_ref.open(name) as src, open(f"{target}.part", 'wb') as dst:
+            while True:
+                buffer = src.read(EXTRACT_BUFFER_BYTES)
+                if not buffer:
+                    break
+                dst.write(buffer)
+                digest.update(buffer)
+                size += len(buffer)
+    os.replace(f"{target}.part", target)
+    return name, size, time.perf_counter() - start, digest.hexdigest()
+
+
+def list_members(zip_path, members=None):
+    """
+    Names of the files in an archive, largest first, optionally limited to `members`.
+    
+    Raises:
+        KeyError: if a requested member is not in the archive
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        infos = [info for info in zip_ref.infolist() if not info.is_dir()]
+    if members is not None:
+        missing = set(members) - {info.filename for info in infos}
+        if missing:
+            raise KeyError(f"Members not found in {zip_path}: {sorted(missing)}")
+        infos = [info for info in infos if info.filename in members]
+    infos.sort(key=lambda info: info.file_size, reverse=True)
+    return [info.filename for info in infos]
+
+
+def extract_members(zip_path, destination, names, workers=EXTRACT_WORKERS):
+    """
+    Extract the named members, in up to `workers` processes at once, and log each one's time.
+    
+    Returns:
+        List of (member name, bytes, seconds, sha256) in the order of `names`
+    """
+    start = time.perf_counter()
+    if workers > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(names))) as pool:
+            futures = [pool.submit(extract_member, zip_path, name, destination) for name in names]
+            results = [future.result() for future in futures]
+    else:
+        results = [extract_member(zip_path, name, destination) for name in names]
+    
+    for name, size, seconds, _ in results:
+        logger.info(f"  {name}: {size / (1024*1024):,.1f} MB in {seconds:.2f}s "
+                    f"({size / (1024*1024) / seconds if seconds > 0 else 0:,.1f} MB/s)")
+    total_mb = sum(result[1] for result in results) / (1024*1024)
+    logger.info(f"Extracted {len(names)} files ({total_mb:,.1f} MB) in {time.perf_counter() - start:.2f}s "
+                f"over {min(workers, len(names)) if names else 0} process(es)")
+    return results
+
+
+def extract_zip(zip_path, destination, members=EXTRACT_MEMBERS, workers=EXTRACT_WORKERS):
     """
     Extract a zip file to a destination folder.
     
+    Only the listed members are extracted. Members are decompressed concurrently
+    in up to `workers` processes, largest first, and each one's time is logged.
+    
     Args:
         zip_path: Path to the zip file
         destination: Folder to extract to
+        members: Member names to extract (None extracts everything)
+        workers: Processes decompressing members at the same time
     
     Returns:
         List of extracted files
     """
     try:
         logger.info(f"Extracting {zip_path}")
-        
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(destination)
-            extracted_files = zip_ref.namelist()
-        
-        logger.info(f"Extracted {len(extracted_files)} files")
-        return extracted_files
+        names = list_members(zip_path, members)
+        extract_members(zip_path, destination, names, workers)
+        return names
         
     except zipfile.BadZipFile as e:
         logger.error(f"Extraction failed: {e}")
         raise
 
 
-def main():
-    """Main function to download and extract MovieLens data."""
+def store_dataset(zip_path, run_dir, extract=EXTRACT_ZIP, members=EXTRACT_MEMBERS, workers=EXTRACT_WORKERS,
+                  store_path=RAW_STORE_PATH):
+    """
+    Put a downloaded archive (and its extracted members) in the raw store and link them into run_dir.
+    
+    The archive is stored under the SHA-256 computed while downloading it. Members
+    already stored for this archive by an earlier run are reused without
+    extracting them; the rest are extracted once, hashed while being written,
+    and deduplicated against everything else in the store. The files are then
+    hardlinked into run_dir, and into DATA_RAW_PATH, which keeps pointing at the
+    latest run for the loading tasks.
+    
+    Args:
+        zip_path: Downloaded archive (with its download metadata next to it)
+        run_dir: This run's working directory
+        extract: Also store and link the archive's members
+        members: Member names to extract (None = all)
+        workers: Processes decompressing members at the same time
+        store_path: Root of the raw store
+    
+    Returns:
+        List of member names linked into run_dir
+    """
+    store = RawStore(store_path)
+    archive_sha = read_sidecar(zip_path).get('sha256') or hash_file(zip_path).hexdigest()
+    store.add(zip_path, archive_sha)
+    linked = {os.path.basename(zip_path): archive_sha}
+    
+    names = []
+    if extract:
+        names = list_members(zip_path, members)
+        stored = store.stored_members(archive_sha, names)
+        if stored:
+            logger.info(f"Reusing {len(stored)} member(s) already extracted from archive {archive_sha[:12]}")
+        todo = [name for name in names if name not in stored]
+        if todo:
+            logger.info(f"Extracting {zip_path} into the raw store")
+            scratch = os.path.join(store.tmp, f"extract-{archive_sha[:12]}-{os.getpid()}")
+            try:
+                recorded = {}
+                for name, size, _, sha256 in extract_members(zip_path, scratch, todo, workers):
+                    store.add(os.path.join(scratch, *name.split('/')), sha256)
+                    recorded[name] = {'sha256': sha256, 'size': size}
+                    stored[name] = sha256
+                store.write_archive(archive_sha, recorded)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+        linked.update(stored)
+    
+    for base in (run_dir, DATA_RAW_PATH):
+        for relative, sha256 in linked.items():
+            store.link(sha256, os.path.join(base, *relative.split('/')))
+        store.write_manifest(base, linked)
+    logger.info(f"Linked {len(linked)} file(s) into {run_dir} and {DATA_RAW_PATH}")
+    return names
+
+
+def run_id():
+    """Name of this run's working directory: the Airflow run id when there is one, else a timestamp."""
+    name = os.environ.get('AIRFLOW_CTX_DAG_RUN_ID') or datetime.now().strftime("%Y%m%dT%H%M%S")
+    return re.sub(r'[^A-Za-z0-9_.+-]', '_', name)
+
+
+def prune_runs(runs_path, keep):
+    """
+    Delete all but the newest `keep` run directories (their files stay in the store).
+
+    Returns:
+        Paths of the kept run directories
+    """
+    if not os.path.isdir(runs_path):
+        return []
+    runs = sorted((entry for entry in os.scandir(runs_path) if entry.is_dir()),
+                  key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in runs[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+        logger.info(f"Removed old run directory {entry.path}")
+    return [entry.path for entry in runs[:keep]]
+
+
+def main(force=False):
+    """
+    Main function to download and extract MovieLens data.
+    
+    Args:
+        force: Download even if the server says the archive is unchanged
+    
+    Returns:
+        (zip path, extracted files, whether the dataset changed)
+    """
     logger.info("=" * 50)
     logger.info("TASK 1: Download MovieLens Dataset")
     logger.info("=" * 50)
     
     start_time = datetime.now()
     
-    # Step 1: Download the zip file
-    zip_path = download_file(MOVIELENS_URL, DATA_RAW_PATH)
-    
-    # Step 2: Extract the zip file
-    extracted_files = extract_zip(zip_path, DATA_RAW_PATH)
-    
-    # Log the extracted files
-    logger.info("Extracted files:")
-    for f in extracted_files[:10]:  # Show first 10 files
-        logger.info(f"  - {f}")
+    # Only one process (on any host sharing DATA_RAW_PATH) downloads and extracts at a time;
+    # the others wait for it and then reuse what it downloaded
+    zip_path = os.path.join(DATA_RAW_PATH, ZIP_FILENAME)
+    previous = read_sidecar(zip_path)
+    with FileLock(f"{zip_path}.lock", timeout=DOWNLOAD_LOCK_TIMEOUT, stale_after=DOWNLOAD_LOCK_STALE_AFTER) as lock:
+        # Step 0: Skip everything if the archive we have is still current and a run processed it
+        status = "updated"
+        if lock.waited and read_sidecar(zip_path) != previous and os.path.exists(zip_path):
+            logger.info("Another worker downloaded the dataset while we waited, reusing it")
+        elif not force and is_unchanged(MOVIELENS_URL, zip_path):
+            sha256 = read_sidecar(zip_path).get('sha256')
+            if sha256 and sha256 == read_processed_sha256():
+                logger.info("Dataset unchanged since the last download, skipping download and extraction")
+                write_dataset_status("unchanged", zip_path)
+                logger.info(f"Task 1 completed in {(datetime.now() - start_time).total_seconds():.2f} seconds")
+                return zip_path, [], False
+            logger.info("Dataset unchanged since the last download, but no pipeline run finished "
+                        "processing it, processing it again")
+            status = "unprocessed"
+        else:
+            # Step 1: Download the zip file
+            zip_path = download_file(MOVIELENS_URL, DATA_RAW_PATH, lost=lock.lost)
+        
+        # Step 2: Store the archive (and extracted files) by content and link them into this run's directory
+        lock.check()
+        run_dir = None
+        if RAW_STORE_PATH:
+            run_dir = os.path.join(RAW_RUNS_PATH, run_id())
+            extracted_files = store_dataset(zip_path, run_dir)
+            kept_runs = prune_runs(RAW_RUNS_PATH, RAW_RUNS_KEEP)
+            # Files only the pruned runs (or replaced versions in data/raw/) used
+            RawStore(RAW_STORE_PATH).collect_garbage(live_dirs=kept_runs + [DATA_RAW_PATH])
+            for f in extracted_files[:10]:
+                logger.info(f"  - {f}")
+        
+        # Step 2: Extract the zip file (optional, the loader can read the archive directly)
+        elif EXTRACT_ZIP:
+            extracted_files = extract_zip(zip_path, DATA_RAW_PATH)
+            
+            # Log the extracted files
+            logger.info("Extracted files:")
+            for f in extracted_files[:10]:  # Show first 10 files
+                logger.info(f"  - {f}")
+        else:
+            extracted_files = []
+            logger.info("Skipping extraction (EXTRACT_ZIP = False), staging reads the zip directly")
+        
+        write_dataset_status(status, zip_path, run_dir=run_dir)
     
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
     logger.info(f"Task 1 completed in {duration:.2f} seconds")
     
-    return zip_path, extracted_files
+    return zip_path, extracted_files, True
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download the MovieLens dataset")
+    parser.add_argument('--force', action='store_true',
+                        help="Download even if the server reports the archive unchanged")
+    parser.add_argument('--exit-code-if-unchanged', type=int, default=0,
+                        help="Exit with this code when the dataset is unchanged "
+                             "(Airflow's BashOperator skips the task and its downstream on 99)")
+    parser.add_argument('--mark-processed', action='store_true',
+                        help="Record the last downloaded dataset as processed (the pipeline's last step) and exit")
+    args = parser.parse_args()
+    if args.mark_processed:
+        mark_processed()
+        sys.exit(0)
+    _, _, changed = main(force=args.force)
+    sys.exit(0 if changed else args.exit_code_if_unchanged)
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Lock file shared by processes on different hosts, e.g. Airflow workers using
+the same NFS data directory.
+The lock is a file created with O_CREAT | O_EXCL, which is atomic on local
+filesystems and NFSv3+. Its owner touches it every few seconds; a waiter
+that sees the lock unchanged for `stale_after` seconds (measured on its own
+clock, so clock skew between hosts doesn't matter), or held by a dead
+process on its own host, removes it and takes over.
+
+An owner whose lock was taken over anyway (it stalled for longer than
+`stale_after`) finds out from its heartbeat, which sets `lost`; work done
+under the lock should check it (or call check()) before touching shared files.
+
+Example:
+    with FileLock("data/raw/ml-32m.zip.lock") as lock:
+        if lock.waited:
+            ...  # someone else held it, their result may already be there
+        lock.check()
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a lock could not be acquired within the timeout."""
+
+
+class LockLost(RuntimeError):
+    """Raised by FileLock.check() when another process took the lock over from us."""
+
+
+class FileLock:
+    """
+    Exclusive lock on a path, held with a heartbeat and recovered when its owner dies.
+
+    Attributes:
+        path: The lock file
+        waited: Whether another process held the lock when we first tried it
+        lost: Event set when another process took the lock over while we held it
+    """
+
+    def __init__(self, path, timeout=None, stale_after=120, poll_interval=2):
+        """
+        Args:
+            path: Lock file to create
+            timeout: Seconds to wait before raising LockTimeout (None = wait forever)
+            stale_after: Seconds without a heartbeat after which the owner is presumed dead
+            poll_interval: Seconds between attempts while waiting
+        """
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = max(stale_after / 4, 0.1)
+        self.owner = {'host': socket.gethostname(), 'pid': os.getpid(), 'token': uuid.uuid4().hex}
+        self.waited = False
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _try_create(self):
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(self.owner, acquired_at=time.time()), f)
+        return True
+
+    def _read(self):
+        """Return (owner dict, mtime) of the current lock file, or (None, None) if there is none."""
+        try:
+            with open(self.path) as f:
+                stat = os.fstat(f.fileno())
+                content = f.read()
+        except FileNotFoundError:
+            return None, None
+        try:
+            return json.loads(content), stat.st_mtime
+        except ValueError:
+            # Being written right now, or left empty by a crash; the heartbeat check decides which
+            return {}, stat.st_mtime
+
+    def _owner_is_dead(self, owner):
+        """True if the owner is a process on this host that no longer exists."""
+        if owner.get('host') != self.owner['host'] or not owner.get('pid'):
+            return False
+        try:
+            os.kill(owner['pid'], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def _break(self, stale):
+        """Remove a stale lock, unless it changed hands since we looked at it."""
+        aside = f"{self.path}.stale-{self.owner['token']}"
+        try:
+            os.rename(self.path, aside)
+        except FileNotFoundError:
+            return
+        with open(aside) as f:
+            content = f.read()
+        try:
+            taken = json.loads(content)
+        except ValueError:
+            taken = {}
+        if taken.get('token') != stale.get('token'):
+            # A new owner created the lock after we looked, put theirs back
+            try:
+                os.link(aside, self.path)
+            except FileExistsError:
+                pass
+        else:
+            logger.warning(f"Removed stale lock {self.path} held by "
+                           f"{stale.get('host', '?')} pid {stale.get('pid', '?')}")
+        os.remove(aside)
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        start = time.monotonic()
+        seen = None      # (token, mtime) of the lock as last observed
+        seen_since = start
+        while not self._try_create():
+            owner, mtime = self._read()
+            if owner is None:
+                continue
+            if not self.waited:
+                self.waited = True
+                logger.info(f"{self.path} is held by {owner.get('host', '?')} pid {owner.get('pid', '?')}, waiting")
+
+            now = time.monotonic()
+            state = (owner.get('token'), mtime)
+            if state != seen:
+                seen, seen_since = state, now
+            if self._owner_is_dead(owner) or now - seen_since > self.stale_after:
+                self._break(owner)
+                seen = None
+                continue
+
+            if self.timeout is not None and now - start > self.timeout:
+                raise LockTimeout(f"Timed out after {self.timeout}s waiting for {self.path}")
+            time.sleep(self.poll_interval)
+
+        if self.waited:
+            logger.info(f"Acquired {self.path} after waiting {time.monotonic() - start:.1f}s")
+        self._stop.clear()
+        self.lost.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name="file-lock-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def _beat(self):
+        missing = False
+        while not self._stop.wait(self.heartbeat_interval):
+            owner, _ = self._read()
+            if owner is None and not missing:
+                # Possibly a waiter's _break() moving it aside for a moment, look again next beat
+                missing = True
+                continue
+            if not owner or owner.get('token') != self.owner['token']:
+                logger.error(f"Lost {self.path}: another process took it over")
+                self.lost.set()
+                return
+            missing = False
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                pass
+    
+    def check(self):
+        """Raise LockLost if another process took the lock over from us."""
+        if self.lost.is_set():
+            raise LockLost(f"{self.path} was taken over by another process")
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        owner, _ = self._read()
+        if owner and owner.get('token') == self.owner['token']:
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -3,16 +3,38 @@ Load CSV files to staging tables in PostgreSQL.
 Task 2: Extract and load movies.csv and ratings.csv to staging tables
 """
 
+import io
 import os
+import json
 import sys
+import time
+import queue
+import hashlib
+import resource
+import zipfile
+import threading
+from contextlib import closing, nullcontext
+import struct
+import psutil
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 import logging
 from sqlalchemy import create_engine, text
 from datetime import datetime
 
 # Add parent directory to path so we can import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config.config import DATABASE_URL, DATA_RAW_PATH, LOGS_PATH
+from config.config import (
+    DATABASE_URL, DATA_RAW_PATH, LOGS_PATH, ZIP_FILENAME, LOAD_FROM_ZIP, LOAD_METHOD, LOAD_CHUNKSIZE, LOAD_WORKERS,
+    STAGING_TABLE_MODE, LOAD_SESSION_SETTINGS, PARSE_ENGINE, INCREMENTAL_TABLES, LOAD_QUEUE_DEPTH,
+    ADAPTIVE_CHUNKSIZE, ADAPTIVE_MIN_ROWS, ADAPTIVE_MAX_ROWS, LOAD_MEMORY_BUDGET_MB,
+    WRITE_RATINGS_CACHE, RATINGS_CACHE_PATH
+)
+from progress import ProgressReporter
+from ratings_cache import build_ratings_cache, discard_stale_cache, remove_ratings_cache
+from ratings_reader import RATINGS_COLUMNS, iter_mmap_blocks, parse_ratings_block
+from movie_titles import parse_titles
 
 # Setup logging
 logging.basicConfig(
@@ -25,6 +47,100 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Explicit column types for the staging tables, in CSV column order.
+# Used by the COPY loader so types don't depend on what pandas infers
+# from the first chunk.
+STAGING_TABLES = {
+    "staging_movies": [
+        ("movieId", "INTEGER"),
+        ("title", "TEXT"),
+        ("genres", "TEXT"),
+    ],
+    "staging_ratings": [
+        ("userId", "INTEGER"),
+        ("movieId", "INTEGER"),
+        ("rating", "REAL"),
+        ("timestamp", "BIGINT"),
+    ],
+}
+
+# Parse dtypes per staging table. Declaring them keeps chunks small
+# (int32 ids, float32 ratings) and stops types drifting between chunks.
+# The integer types are pandas' nullable ones, so a row with an empty id or
+# timestamp is loaded as NULL (and counted and dropped by the transform)
+# instead of failing the load.
+STAGING_DTYPES = {
+    "staging_movies": {
+        "movieId": "Int32",
+        "title": "string",
+        "genres": "category",
+    },
+    "staging_ratings": {
+        "userId": "Int32",
+        "movieId": "Int32",
+        "rating": "float32",
+        "timestamp": "Int64",
+    },
+}
+
+# Columns computed from each parsed chunk and stored after the CSV columns,
+# see derive_columns()
+STAGING_DERIVED_COLUMNS = {
+    "staging_movies": [
+        ("release_year", "INTEGER"),
+        ("clean_title", "TEXT"),
+    ],
+}
+
+PARSE_ENGINES = ("c", "pyarrow", "numpy")
+
+# Key columns whose order the loader records per block (in the ledger), so that a
+# source sorted by its key proves the table has no duplicate keys, see unique_key_proven()
+STAGING_SORT_KEYS = {
+    "staging_ratings": ("userId", "movieId"),
+}
+
+# Indexes and statistics built only once the data is in (COPY methods)
+STAGING_POST_LOAD_SQL = {
+    "staging_movies": [
+        'CREATE INDEX IF NOT EXISTS idx_staging_movies_movieid ON staging_movies ("movieId")',
+        "ANALYZE staging_movies",
+    ],
+    "staging_ratings": [
+        # The file is sorted by userId, so a tiny BRIN index lets each userId range of
+        # a partitioned transform read only its own part of the table
+        'CREATE INDEX IF NOT EXISTS idx_staging_ratings_userid_brin ON staging_ratings USING brin ("userId")',
+        "ANALYZE staging_ratings",
+    ],
+}
+
+LOAD_METHODS = ("to_sql", "copy", "binary")
+
+# High-water mark of the last load of each staging table, see load_watermark()
+WATERMARK_TABLE = "staging_watermarks"
+# Bytes hashed at the start of the file and just before the watermark offset
+FINGERPRINT_BYTES = 1024 * 1024
+
+# One row per committed block of an in-progress or finished COPY load, written
+# in the same transaction as the block's data. See find_resume_ranges().
+LEDGER_TABLE = "staging_load_ledger"
+
+# logged:   regular heap table, committed block by block
+# unlogged: CREATE UNLOGGED TABLE, no WAL for the table data
+# freeze:   create and fill in one transaction with COPY ... FREEZE
+STAGING_TABLE_MODES = ("logged", "unlogged", "freeze")
+
+# Big-endian wire format of each column type in PGCOPY binary tuples
+PGCOPY_TYPES = {
+    "SMALLINT": ">i2",
+    "INTEGER": ">i4",
+    "BIGINT": ">i8",
+    "REAL": ">f4",
+    "DOUBLE PRECISION": ">f8",
+}
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)  # signature, flags, extension length
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
 
 def create_engine_connection():
     """Create database engine connection."""
@@ -37,48 +153,1346 @@ def create_engine_connection():
         raise
 
 
-def load_csv_to_staging(engine, csv_path, table_name, chunksize=100000):
+def table_columns(table_name):
+    """Return (name, type) of every column of a staging table: the CSV columns, then the derived ones."""
+    return STAGING_TABLES[table_name] + STAGING_DERIVED_COLUMNS.get(table_name, [])
+
+
+def derive_columns(chunk, table_name):
+    """Add a parsed chunk's derived columns (STAGING_DERIVED_COLUMNS), e.g. release_year from title."""
+    if table_name == "staging_movies":
+        chunk = pd.concat([chunk, parse_titles(chunk["title"])], axis=1)
+    return chunk
+
+
+def quote_columns(table_name):
+    """Return the quoted, comma separated column list of a staging table."""
+    return ", ".join(f'"{name}"' for name, _ in table_columns(table_name))
+
+
+def create_staging_table(cursor, table_name, unlogged=False):
+    """
+    Drop and recreate a staging table with explicit column types.
+    
+    Args:
+        cursor: psycopg2 cursor
+        table_name: Name of the staging table (must be in STAGING_TABLES)
+        unlogged: Create the table UNLOGGED (its data is not written to WAL)
+    """
+    columns = ", ".join(f'"{name}" {pg_type}' for name, pg_type in table_columns(table_name))
+    kind = "UNLOGGED TABLE" if unlogged else "TABLE"
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+    cursor.execute(f"CREATE {kind} {table_name} ({columns})")
+    logger.info(f"Created {kind.lower()} {table_name} ({columns})")
+
+
+def finalize_staging_table(cursor, table_name):
+    """Build the indexes and statistics of a staging table after its data is loaded."""
+    for statement in STAGING_POST_LOAD_SQL.get(table_name, []):
+        cursor.execute(statement)
+        logger.info(f"Post-load: {statement}")
+
+
+def apply_session_settings(cursor, settings=LOAD_SESSION_SETTINGS):
+    """Apply the fast-load session profile (e.g. synchronous_commit = off)."""
+    for name, value in settings.items():
+        cursor.execute(f"SET {name} = %s", (value,))
+
+
+def current_wal_lsn(cursor):
+    """Return the server's current WAL insert position."""
+    cursor.execute("SELECT pg_current_wal_lsn()")
+    return cursor.fetchone()[0]
+
+
+def wal_bytes_since(cursor, lsn):
+    """Return the number of WAL bytes the server generated since `lsn` (server wide)."""
+    cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (lsn,))
+    return int(cursor.fetchone()[0])
+
+
+def copy_payload(cursor, payload, table_name, binary=False, freeze=False):
+    """
+    Send an encoded chunk (see encode_chunk) to a table with COPY ... FROM STDIN.
+    
+    Args:
+        cursor: psycopg2 cursor
+        payload: CSV text or PGCOPY binary bytes
+        table_name: Name of the target table
+        binary: payload is in PGCOPY binary format
+        freeze: Add the FREEZE option (table must be created in the same transaction)
+    """
+    options = "FORMAT binary" if binary else "FORMAT csv, NULL '\\N'"
+    if freeze:
+        options += ", FREEZE"
+    cursor.copy_expert(
+        f"COPY {table_name} ({quote_columns(table_name)}) FROM STDIN WITH ({options})",
+        io.BytesIO(payload)
+    )
+
+
+def copy_chunk(cursor, chunk, table_name, freeze=False):
+    """
+    Stream a DataFrame chunk into a table with COPY ... FROM STDIN.
+    
+    Args:
+        cursor: psycopg2 cursor
+        chunk: DataFrame whose columns are in table column order
+        table_name: Name of the target table
+        freeze: Add the FREEZE option (table must be created in the same transaction)
+    """
+    copy_payload(cursor, encode_chunk(chunk, table_name), table_name, freeze=freeze)
+
+
+def supports_binary_copy(table_name):
+    """Binary COPY is only implemented for all-numeric tables (e.g. staging_ratings)."""
+    return all(pg_type in PGCOPY_TYPES for _, pg_type in table_columns(table_name))
+
+
+def supports_numpy_parser(table_name):
+    """The memory-mapped NumPy parser only understands the ratings.csv layout."""
+    return list(STAGING_DTYPES[table_name]) == RATINGS_COLUMNS
+
+
+def _pack_tuples(arrays, pg_types, null_columns):
+    """Pack rows whose NULL columns are exactly `null_columns` into PGCOPY tuples (a NULL is length -1, no value)."""
+    fields = [("field_count", ">i2")]
+    for i, pg_type in enumerate(pg_types):
+        fields.append((f"len_{i}", ">i4"))
+        if not null_columns[i]:
+            fields.append((f"val_{i}", PGCOPY_TYPES[pg_type]))
+    
+    tuples = np.empty(len(arrays[0]), dtype=np.dtype(fields))
+    tuples["field_count"] = len(arrays)
+    for i, (values, pg_type) in enumerate(zip(arrays, pg_types)):
+        if null_columns[i]:
+            tuples[f"len_{i}"] = -1
+        else:
+            tuples[f"len_{i}"] = np.dtype(PGCOPY_TYPES[pg_type]).itemsize
+            tuples[f"val_{i}"] = values
+    return tuples.tobytes()
+
+
+def encode_pgcopy_binary(arrays, pg_types, nulls=None):
+    """
+    Pack column arrays into the PGCOPY binary format.
+    
+    Every tuple is a 16-bit field count followed by a 32-bit length and the
+    big-endian value of each field. The tuples are laid out as one packed
+    NumPy structured array, so all rows are encoded with a handful of
+    vectorized column assignments instead of a struct.pack per row.
+    Rows with NULLs have a different layout, so they are packed after the
+    others, one structured array per combination of NULL columns.
+    
+    Args:
+        arrays: Sequence of equal-length 1-D arrays, one per column
+        pg_types: PostgreSQL type of each column (keys of PGCOPY_TYPES)
+        nulls: Optional boolean arrays, one per column, marking its NULLs
+            (their values in `arrays` are ignored)
+    
+    Returns:
+        bytes holding header, tuples and trailer, ready for COPY ... FROM STDIN WITH (FORMAT binary)
+    """
+    if len(arrays) != len(pg_types):
+        raise ValueError(f"Got {len(arrays)} arrays for {len(pg_types)} column types")
+    if not arrays:
+        return PGCOPY_HEADER + PGCOPY_TRAILER
+    
+    num_rows = len(arrays[0])
+    arrays = [np.asarray(values) for values in arrays]
+    for i, values in enumerate(arrays):
+        if len(values) != num_rows:
+            raise ValueError(f"Column {i} has {len(values)} values, expected {num_rows}")
+        if nulls is None and values.dtype.kind == "f" and np.isnan(values).any():
+            raise ValueError(f"Column {i} contains NaN, pass `nulls` to encode it as NULL")
+    
+    if nulls is None:
+        return PGCOPY_HEADER + _pack_tuples(arrays, pg_types, [False] * len(arrays)) + PGCOPY_TRAILER
+    null_matrix = np.column_stack([np.asarray(mask, dtype=bool) for mask in nulls])
+    has_null = null_matrix.any(axis=1)
+    parts = [PGCOPY_HEADER]
+    if not has_null.all():
+        keep = ~has_null
+        parts.append(_pack_tuples([values[keep] for values in arrays], pg_types, [False] * len(arrays)))
+    if has_null.any():
+        rows = np.flatnonzero(has_null)
+        patterns, group = np.unique(null_matrix[rows], axis=0, return_inverse=True)
+        for index, pattern in enumerate(patterns):
+            selected = rows[group.ravel() == index]
+            parts.append(_pack_tuples([values[selected] for values in arrays], pg_types, pattern.tolist()))
+    parts.append(PGCOPY_TRAILER)
+    return b"".join(parts)
+
+
+def copy_chunk_binary(cursor, chunk, table_name, freeze=False):
+    """
+    Stream a numeric DataFrame chunk into a table with binary COPY.
+    
+    Args:
+        cursor: psycopg2 cursor
+        chunk: DataFrame whose columns are in table column order
+        table_name: Name of the target table (must support binary COPY)
+        freeze: Add the FREEZE option (table must be created in the same transaction)
+    """
+    payload = encode_chunk(chunk, table_name, binary=True)
+    copy_payload(cursor, payload, table_name, binary=True, freeze=freeze)
+
+
+def encode_chunk(chunk, table_name, binary=False):
+    """Encode a DataFrame chunk as a COPY payload: CSV text, or PGCOPY binary for numeric tables."""
+    if binary:
+        pg_types = [pg_type for _, pg_type in table_columns(table_name)]
+        # Nullable columns become plain arrays plus a NULL mask
+        arrays = [chunk[column].to_numpy(dtype=np.dtype(PGCOPY_TYPES[pg_type]).newbyteorder("="), na_value=0)
+                  for column, pg_type in zip(chunk.columns, pg_types)]
+        nulls = [chunk[column].isna().to_numpy() for column in chunk.columns]
+        return encode_pgcopy_binary(arrays, pg_types, nulls)
+    # NULL is written as \N (see copy_payload), so an empty clean_title stays an empty string
+    return chunk.to_csv(index=False, header=False, na_rep='\\N').encode('utf-8')
+
+
+def open_csv(csv_path, zip_path=None):
+    """
+    Open a CSV for binary reading, either from disk or as a member of a zip archive.
+    
+    Zip members are decompressed on the fly while reading, nothing is extracted to disk.
+    
+    Args:
+        csv_path: Path to the CSV file, or the member name when zip_path is given
+        zip_path: Optional zip archive containing csv_path
+    """
+    if zip_path is None:
+        return open(csv_path, 'rb')
+    archive = zipfile.ZipFile(zip_path)
+    try:
+        member = archive.open(csv_path)
+    except Exception:
+        archive.close()
+        raise
+    # ZipFile keeps a reference count of open members, so closing it now
+    # only releases the archive once the member is closed as well
+    archive.close()
+    return member
+
+
+def csv_size(csv_path, zip_path=None):
+    """Size of a CSV in bytes (uncompressed size for zip members)."""
+    if zip_path is None:
+        return os.path.getsize(csv_path)
+    with zipfile.ZipFile(zip_path) as archive:
+        return archive.getinfo(csv_path).file_size
+
+
+def csv_exists(csv_path, zip_path=None):
+    """Check a CSV file, or a member of a zip archive, exists."""
+    if zip_path is None:
+        return os.path.exists(csv_path)
+    if not os.path.exists(zip_path):
+        return False
+    with zipfile.ZipFile(zip_path) as archive:
+        return csv_path in archive.namelist()
+
+
+def source_fingerprint(csv_path, offset, zip_path=None):
+    """
+    Fingerprint the first `offset` bytes of a CSV.
+    
+    Hashes the header and first MB of data plus the MB just before `offset`.
+    An append-only source keeps the same fingerprint at the old offset, while
+    a rewritten file (new release, re-sorted, truncated) changes it.
+    
+    A zip member can't be read at an offset without inflating everything before
+    it, so it is fingerprinted by the CRC-32, size and date in the archive's
+    central directory instead. Any change to the member then changes the
+    fingerprint, and a grown member is reloaded in full rather than appended.
+    """
+    digest = hashlib.sha256(str(offset).encode())
+    if zip_path is not None:
+        with zipfile.ZipFile(zip_path) as archive:
+            info = archive.getinfo(csv_path)
+        digest.update(f"{info.CRC:08x}:{info.file_size}:{info.date_time}".encode())
+        return digest.hexdigest()
+    with open_csv(csv_path, zip_path) as f:
+        digest.update(f.read(min(FINGERPRINT_BYTES, offset)))
+        tail_start = max(offset - FINGERPRINT_BYTES, 0)
+        f.seek(tail_start)
+        digest.update(f.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+def ends_with_newline(csv_path, offset, zip_path=None):
+    """Check the byte before `offset` is a newline, i.e. offset is a line start."""
+    with open_csv(csv_path, zip_path) as f:
+        f.seek(offset - 1)
+        return f.read(1) == b'\n'
+
+
+def ensure_watermark_table(cursor):
+    """Create the watermark table if it doesn't exist yet."""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            byte_offset BIGINT NOT NULL,
+            max_timestamp BIGINT,
+            fingerprint TEXT NOT NULL,
+            total_rows BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def get_watermark(cursor, table_name):
+    """Return the stored watermark of a staging table as a dict, or None."""
+    cursor.execute(f"""
+        SELECT source, byte_offset, max_timestamp, fingerprint, total_rows
+        FROM {WATERMARK_TABLE} WHERE table_name = %s
+    """, (table_name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    keys = ('source', 'byte_offset', 'max_timestamp', 'fingerprint', 'total_rows')
+    return dict(zip(keys, row))
+
+
+def save_watermark(cursor, table_name, source, byte_offset, fingerprint, total_rows, max_timestamp=None):
+    """
+    Store the watermark of a table (call in the load's final transaction).
+    
+    For staging tables with a timestamp column max_timestamp is read from the
+    table; tables derived from a staging table pass it in and use the staging
+    table's name as their source.
+    """
+    if max_timestamp is None and any(name == "timestamp" for name, _ in STAGING_TABLES.get(table_name, ())):
+        cursor.execute(f'SELECT MAX("timestamp") FROM {table_name}')
+        max_timestamp = cursor.fetchone()[0]
+    cursor.execute(f"""
+        INSERT INTO {WATERMARK_TABLE}
+            (table_name, source, byte_offset, max_timestamp, fingerprint, total_rows, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (table_name) DO UPDATE SET
+            source = EXCLUDED.source,
+            byte_offset = EXCLUDED.byte_offset,
+            max_timestamp = EXCLUDED.max_timestamp,
+            fingerprint = EXCLUDED.fingerprint,
+            total_rows = EXCLUDED.total_rows,
+            updated_at = EXCLUDED.updated_at
+    """, (table_name, source, byte_offset, max_timestamp, fingerprint, total_rows))
+    logger.info(f"Watermark for {table_name}: byte {byte_offset:,}, {total_rows:,} rows, "
+                f"max timestamp {max_timestamp}")
+
+
+def clear_watermark(cursor, table_name):
+    """
+    Forget the watermark of a staging table before it is rebuilt.
+    
+    Watermarks of tables derived from it go too: they can only be updated
+    incrementally while the staging table is only ever appended to.
+    """
+    cursor.execute(f"DELETE FROM {WATERMARK_TABLE} WHERE table_name = %s OR source = %s",
+                   (table_name, table_name))
+
+
+def table_exists(cursor, table_name):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+    return cursor.fetchone()[0]
+
+
+def count_rows(cursor, table_name):
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
+
+
+def table_has_columns(cursor, table_name):
+    """True if an existing staging table has exactly the columns of table_columns(), in order."""
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table_name,))
+    return [row[0] for row in cursor.fetchall()] == [name for name, _ in table_columns(table_name)]
+
+
+def ensure_ledger_table(cursor):
+    """Create the chunk ledger table if it doesn't exist yet."""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+            table_name TEXT NOT NULL,
+            source TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            range_start BIGINT NOT NULL,
+            byte_start BIGINT NOT NULL,
+            byte_end BIGINT NOT NULL,
+            row_start BIGINT NOT NULL,
+            row_end BIGINT NOT NULL,
+            loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            key_first BIGINT,
+            key_last BIGINT,
+            keys_sorted BOOLEAN,
+            profile JSONB,
+            PRIMARY KEY (table_name, byte_start)
+        )
+    """)
+    # Ledgers created before the key and profile columns existed
+    for column, pg_type in (("key_first", "BIGINT"), ("key_last", "BIGINT"), ("keys_sorted", "BOOLEAN"),
+                            ("profile", "JSONB")):
+        cursor.execute(f"ALTER TABLE {LEDGER_TABLE} ADD COLUMN IF NOT EXISTS {column} {pg_type}")
+
+
+def record_block(cursor, table_name, ledger_key, range_start, byte_start, byte_end, row_start, row_end,
+                 keys=(None, None, None), profile=None):
+    """
+    Add a loaded block to the ledger (in the transaction that copied it).
+    
+    Row numbers count from the start of the block's byte range, end exclusive.
+    `keys` is the block's (first key, last key, strictly increasing) from key_order()
+    and `profile` its counters from profile_block().
+    """
+    source, fingerprint = ledger_key
+    cursor.execute(f"""
+        INSERT INTO {LEDGER_TABLE}
+            (table_name, source, fingerprint, range_start, byte_start, byte_end, row_start, row_end,
+             key_first, key_last, keys_sorted, profile)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (table_name, source, fingerprint, range_start, byte_start, byte_end, row_start, row_end, *keys,
+          json.dumps(profile) if profile is not None else None))
+
+
+def profile_block(chunk, table_name):
+    """
+    Count what transform_data.py profiles in a parsed block, so it needn't scan the table for it.
+    
+    Returns:
+        {"rows", "null_<column>" for every column, and for ratings "invalid_rating"
+        (outside 0.5-5.0), "valid" (rows cleaning keeps) and "max_timestamp"}
+    """
+    profile = {"rows": len(chunk)}
+    for column in chunk.columns:
+        profile[f"null_{column}"] = int(chunk[column].isna().sum())
+    if table_name == "staging_ratings":
+        rating = chunk["rating"]
+        in_range = (rating >= 0.5) & (rating <= 5.0)
+        profile["invalid_rating"] = int(((rating < 0.5) | (rating > 5.0)).sum())
+        profile["valid"] = int((chunk[["userId", "movieId"]].notna().all(axis=1) & in_range).sum())
+        profile["max_timestamp"] = int(chunk["timestamp"].max()) if chunk["timestamp"].notna().any() else None
+    return profile
+
+
+def key_order(chunk, table_name):
+    """
+    Summarise the order of a parsed block's key columns (STAGING_SORT_KEYS).
+    
+    The two int32 key columns are packed into one int64 that sorts like the pair.
+    
+    Returns:
+        (first key, last key, whether the keys strictly increase), all None when
+        the table has no sort key, the block is empty or has negative or missing ids
+    """
+    key = STAGING_SORT_KEYS.get(table_name)
+    if key is None or len(chunk) == 0:
+        return None, None, None
+    # Missing ids become -1 and fail the check below
+    high = chunk[key[0]].to_numpy(dtype=np.int64, na_value=-1)
+    low = chunk[key[1]].to_numpy(dtype=np.int64, na_value=-1)
+    if high.min() < 0 or low.min() < 0:
+        return None, None, None
+    packed = (high << 32) | low
+    return int(packed[0]), int(packed[-1]), bool((packed[1:] > packed[:-1]).all())
+
+
+def complete_ledger_blocks(cursor, table_name):
+    """
+    Return the ledger of a staging table if it describes every row in the table.
+    
+    That is the case after a complete COPY load, but not after an incremental
+    one (whose ledger only covers the appended bytes, fewer rows than the
+    watermark records) or a to_sql/streamed load (which clear the ledger).
+    
+    Returns:
+        List of (rows, key_first, key_last, keys_sorted, profile) in file order, or None
+    """
+    cursor.execute(f"""
+        SELECT row_end - row_start, key_first, key_last, keys_sorted, profile, completed_at
+        FROM {LEDGER_TABLE} WHERE table_name = %s ORDER BY byte_start
+    """, (table_name,))
+    blocks = cursor.fetchall()
+    if not blocks or any(block[5] is None for block in blocks):
+        logger.info(f"No complete load ledger for {table_name}")
+        return None
+    watermark = get_watermark(cursor, table_name) if table_exists(cursor, WATERMARK_TABLE) else None
+    ledger_rows = sum(block[0] for block in blocks)
+    if watermark is not None and watermark['total_rows'] != ledger_rows:
+        logger.info(f"The load ledger of {table_name} covers {ledger_rows:,} of its "
+                    f"{watermark['total_rows']:,} rows (after an incremental load)")
+        return None
+    return [block[:5] for block in blocks]
+
+
+def unique_key_proven(cursor, table_name, blocks=None):
+    """
+    Check the ledger proves a staging table has no duplicate STAGING_SORT_KEYS.
+    
+    That holds when the ledger covers every row of the table and the keys
+    strictly increase within each block and from each block to the next in
+    file order, as they do in MovieLens' ratings.csv (sorted by userId, then
+    movieId). `blocks` is complete_ledger_blocks(), if already fetched.
+    """
+    if blocks is None:
+        blocks = complete_ledger_blocks(cursor, table_name)
+    if blocks is None:
+        return False
+    
+    previous = None
+    for rows, key_first, key_last, keys_sorted, _ in blocks:
+        if rows == 0:
+            continue
+        if not keys_sorted or (previous is not None and key_first <= previous):
+            logger.info(f"Keys of {table_name} are not in strictly increasing order in its source")
+            return False
+        previous = key_last
+    logger.info(f"Load ledger proves {table_name} has no duplicate {STAGING_SORT_KEYS[table_name]}")
+    return True
+
+
+def ledger_profile(cursor, table_name, blocks=None):
+    """
+    Add up the profile_block() counters recorded for a staging table while loading it.
+    
+    Returns:
+        The table's counters (max_timestamp is the maximum, the rest are sums),
+        or None when the ledger doesn't cover the table or predates profiles
+    """
+    if blocks is None:
+        blocks = complete_ledger_blocks(cursor, table_name)
+    if blocks is None or any(block[4] is None for block in blocks):
+        return None
+    total = {}
+    for *_, profile in blocks:
+        if isinstance(profile, str):
+            profile = json.loads(profile)
+        for name, value in profile.items():
+            if name.startswith("max_"):
+                if total.get(name) is None or (value is not None and value > total[name]):
+                    total[name] = value
+            else:
+                total[name] = total.get(name, 0) + value
+    return total
+
+
+def clear_ledger(cursor, table_name):
+    """Forget the ledger of a staging table before a fresh load."""
+    cursor.execute(f"DELETE FROM {LEDGER_TABLE} WHERE table_name = %s", (table_name,))
+
+
+def find_resume_ranges(cursor, table_name, ledger_key, data_start, file_size):
+    """
+    Work out what is left to load after an interrupted load.
+    
+    A load can be resumed when its ledger is not marked complete, was written
+    for the same source and fingerprint, and the table still holds exactly the
+    rows the ledger accounts for (an UNLOGGED table is emptied by a server crash).
+    
+    Returns:
+        (byte ranges not yet loaded, rows already loaded), or None to start over
+    """
+    source, fingerprint = ledger_key
+    cursor.execute(f"""
+        SELECT source, fingerprint, byte_start, byte_end, row_end - row_start, completed_at
+        FROM {LEDGER_TABLE} WHERE table_name = %s ORDER BY byte_start
+    """, (table_name,))
+    blocks = cursor.fetchall()
+    if not blocks or blocks[0][5] is not None:
+        return None
+    if any(block[0] != source or block[1] != fingerprint for block in blocks):
+        logger.info(f"Ledger of {table_name} is for a different source or file version, starting over")
+        return None
+    if not table_exists(cursor, table_name):
+        logger.info(f"Ledger of {table_name} found but the table is missing, starting over")
+        return None
+    
+    rows_done = sum(block[4] for block in blocks)
+    table_rows = count_rows(cursor, table_name)
+    if table_rows != rows_done:
+        logger.info(f"{table_name} has {table_rows:,} rows but its ledger records {rows_done:,}, starting over")
+        return None
+    
+    gaps = []
+    position = data_start
+    for _, _, byte_start, byte_end, _, _ in blocks:
+        if byte_start > position:
+            gaps.append((position, byte_start))
+        position = max(position, byte_end)
+    if file_size > position:
+        gaps.append((position, file_size))
+    logger.info(f"Resuming {table_name}: {len(blocks):,} blocks ({rows_done:,} rows) already committed, "
+                f"{sum(end - start for start, end in gaps):,} bytes left in {len(gaps)} range(s)")
+    return gaps, rows_done
+
+
+def complete_ledger(cursor, table_name, expected_start, file_size, expected_rows):
+    """
+    Check the ledger tiles [expected_start, file_size) exactly and mark it complete.
+    
+    Raises:
+        RuntimeError: if blocks overlap, leave gaps, or don't add up to expected_rows
+    """
+    cursor.execute(f"""
+        SELECT byte_start, byte_end, row_end - row_start
+        FROM {LEDGER_TABLE} WHERE table_name = %s ORDER BY byte_start
+    """, (table_name,))
+    position, rows = expected_start, 0
+    for byte_start, byte_end, block_rows in cursor.fetchall():
+        if byte_start != position:
+            raise RuntimeError(f"Ledger of {table_name} has a gap or overlap at byte {position:,}")
+        position, rows = byte_end, rows + block_rows
+    if position != file_size or rows != expected_rows:
+        raise RuntimeError(f"Ledger of {table_name} covers bytes {expected_start:,}-{position:,} with "
+                           f"{rows:,} rows, expected {expected_start:,}-{file_size:,} with {expected_rows:,}")
+    cursor.execute(f"UPDATE {LEDGER_TABLE} SET completed_at = CURRENT_TIMESTAMP WHERE table_name = %s",
+                   (table_name,))
+
+
+def find_append_offset(cursor, table_name, source, csv_path, file_size, zip_path=None):
+    """
+    Decide whether a staging table can be topped up from its watermark.
+    
+    The table must still hold exactly the rows the watermark records (an UNLOGGED
+    table is emptied by a server crash). A watermark that can't be used is cleared,
+    so a failed full reload isn't mistaken for a valid one on the next run.
+    
+    Returns:
+        (byte offset to resume from, rows already loaded), or None when a
+        full reload is needed
+    """
+    watermark = get_watermark(cursor, table_name)
+    if watermark is None:
+        logger.info(f"No watermark for {table_name}, doing a full load")
+        return None
+    offset = watermark['byte_offset']
+    if not table_exists(cursor, table_name):
+        reason = "staging table is missing"
+    elif not table_has_columns(cursor, table_name):
+        reason = "staging table has different columns"
+    elif count_rows(cursor, table_name) != watermark['total_rows']:
+        reason = f"table doesn't hold the {watermark['total_rows']:,} rows the watermark records"
+    elif watermark['source'] != source:
+        reason = f"source changed from {watermark['source']}"
+    elif file_size < offset:
+        reason = f"file shrank below the watermark ({file_size:,} < {offset:,} bytes)"
+    elif source_fingerprint(csv_path, offset, zip_path) != watermark['fingerprint']:
+        reason = "fingerprint mismatch, the file was rewritten rather than appended to"
+    # A zip member with the same fingerprint is the one the watermark was taken at the end of
+    elif zip_path is None and not ends_with_newline(csv_path, offset, zip_path):
+        reason = "watermark is no longer at a line boundary"
+    else:
+        logger.info(f"Watermark for {table_name} at byte {offset:,} ({watermark['total_rows']:,} rows) "
+                    f"is valid, appending {file_size - offset:,} new bytes")
+        return offset, watermark['total_rows']
+    logger.info(f"Full reload of {table_name}: {reason}")
+    clear_watermark(cursor, table_name)
+    return None
+
+
+def load_csv_to_staging(engine, csv_path, table_name, chunksize=LOAD_CHUNKSIZE, method=LOAD_METHOD,
+                        workers=LOAD_WORKERS, table_mode=STAGING_TABLE_MODE, parse_engine=PARSE_ENGINE,
+                        zip_path=None, incremental=None, adaptive=ADAPTIVE_CHUNKSIZE):
     """
     Load a CSV file to a staging table.
     
     Args:
         engine: SQLAlchemy engine
-        csv_path: Path to the CSV file
+        csv_path: Path to the CSV file, or its member name when zip_path is given
         table_name: Name of the staging table
-        chunksize: Number of rows to load at a time
+        chunksize: Number of rows to load at a time (ignored when adaptive)
+        method: "to_sql" for pandas INSERTs, "copy" for text COPY ... FROM STDIN
+            or "binary" for PGCOPY binary COPY (numeric tables only)
+        workers: Number of processes loading byte ranges of the file in parallel
+            (COPY methods only)
+        table_mode: "logged", "unlogged" or "freeze" (COPY methods only)
+        parse_engine: pandas CSV engine, "c" or "pyarrow" (optional dependency), or
+            "numpy" for the memory-mapped ratings parser (falls back to "c" elsewhere)
+        zip_path: Read csv_path straight out of this zip archive instead of from disk
+        incremental: Only append rows past the stored watermark when the source was
+            appended to (COPY methods only). Defaults to table_name in INCREMENTAL_TABLES.
+        adaptive: Size every block from measured rows/sec and RSS instead of chunksize
+            (COPY methods only)
     
     Returns:
         Number of rows loaded
     """
     try:
-        logger.info(f"Loading {csv_path} to {table_name}")
+        source = f"{zip_path}:{csv_path}" if zip_path else csv_path
+        logger.info(f"Loading {source} to {table_name} (method={method}, table_mode={table_mode})")
+        
+        if method not in LOAD_METHODS:
+            raise ValueError(f"Unknown load method: {method} (expected one of {LOAD_METHODS})")
+        if table_mode not in STAGING_TABLE_MODES:
+            raise ValueError(f"Unknown table mode: {table_mode} (expected one of {STAGING_TABLE_MODES})")
+        check_parse_engine(parse_engine)
+        
+        if method == "binary" and not supports_binary_copy(table_name):
+            logger.info(f"{table_name} has non-numeric columns, using text COPY instead of binary")
+            method = "copy"
+        
+        if parse_engine == "numpy" and (zip_path or method == "to_sql" or not supports_numpy_parser(table_name)):
+            logger.info(f"The numpy parser needs {table_name} as an uncompressed ratings file loaded "
+                        f"with COPY, using the c parser instead")
+            parse_engine = "c"
         
         # Check if file exists
-        if not os.path.exists(csv_path):
-            raise FileNotFoundError(f"File not found: {csv_path}")
+        if incremental is None:
+            incremental = table_name in INCREMENTAL_TABLES
+        
+        if not csv_exists(csv_path, zip_path):
+            raise FileNotFoundError(f"File not found: {source}")
+        
+        if zip_path and workers > 1:
+            logger.info("Zip members can't be split into byte ranges cheaply, loading serially")
+            workers = 1
+        
+        logger.info(f"Size to load: {csv_size(csv_path, zip_path) / (1024*1024):,.1f} MB")
         
-        # Get total rows for progress tracking
-        total_rows = sum(1 for _ in open(csv_path)) - 1  # Subtract header
-        logger.info(f"Total rows to load: {total_rows:,}")
+        start = time.perf_counter()
+        if method in ("copy", "binary"):
+            rows_loaded = _load_with_copy(engine, csv_path, table_name, chunksize,
+                                          binary=(method == "binary"), workers=workers,
+                                          table_mode=table_mode, parse_engine=parse_engine,
+                                          zip_path=zip_path, incremental=incremental, adaptive=adaptive)
+        else:
+            if workers > 1 or table_mode != "logged" or incremental:
+                logger.info("Parallel, incremental and table-mode loads need a COPY method, "
+                            "doing a serial full load into a logged table with to_sql")
+            rows_loaded = _load_with_to_sql(engine, csv_path, table_name, chunksize, zip_path)
+        elapsed = time.perf_counter() - start
         
-        # Load in chunks
-        rows_loaded = 0
-        for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize)):
+        rate = rows_loaded / elapsed if elapsed > 0 else 0
+        logger.info(f"Successfully loaded {rows_loaded:,} rows to {table_name} "
+                    f"in {elapsed:.2f}s ({rate:,.0f} rows/sec, method={method})")
+        return rows_loaded
+        
+    except Exception as e:
+        logger.error(f"Failed to load {csv_path} to {table_name}: {e}")
+        raise
+
+
+def _load_with_to_sql(engine, csv_path, table_name, chunksize, zip_path=None):
+    """Load chunks with DataFrame.to_sql (original INSERT based path)."""
+    # The table is rebuilt outside the watermark and ledger bookkeeping, so drop both
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            ensure_watermark_table(cursor)
+            ensure_ledger_table(cursor)
+            clear_watermark(cursor, table_name)
+            clear_ledger(cursor, table_name)
+        connection.commit()
+    finally:
+        connection.close()
+    
+    rows_loaded = 0
+    progress = ProgressReporter(csv_size(csv_path, zip_path), label=table_name)
+    with open_csv(csv_path, zip_path) as f:
+        reader = pd.read_csv(f, chunksize=chunksize, dtype=STAGING_DTYPES[table_name])
+        for i, chunk in enumerate(reader):
             # First chunk replaces table, subsequent chunks append
             if_exists = 'replace' if i == 0 else 'append'
             with engine.connect() as connection:
-                chunk.to_sql(table_name, connection, if_exists=if_exists, index=False)
+                derive_columns(chunk, table_name).to_sql(table_name, connection, if_exists=if_exists, index=False)
             
             rows_loaded += len(chunk)
-            progress = (rows_loaded / total_rows) * 100
-            logger.info(f"Progress: {progress:.1f}% ({rows_loaded:,} / {total_rows:,} rows)")
+            # tell() runs ahead of the parsed rows by pandas' read buffer, close enough for progress
+            progress.update(f.tell(), f"{rows_loaded:,} rows")
+    return rows_loaded
+
+
+def read_csv_header(csv_path, zip_path=None):
+    """
+    Read the header line of a CSV file.
+    
+    Returns:
+        (column names, byte offset where the data rows start)
+    """
+    with open_csv(csv_path, zip_path) as f:
+        header = f.readline()
+    columns = header.decode('utf-8').strip().split(',')
+    return columns, len(header)
+
+
+def estimate_line_bytes(csv_path, data_start, sample_bytes=65536, zip_path=None):
+    """Average length in bytes of the data lines in a sample of the file."""
+    with open_csv(csv_path, zip_path) as f:
+        f.seek(data_start)
+        sample = f.read(sample_bytes)
+    return len(sample) / (sample.count(b'\n') or 1)
+
+
+def estimate_block_bytes(csv_path, data_start, chunksize, sample_bytes=65536, zip_path=None):
+    """Translate a chunk size in rows into a read size in bytes from a sample of the file."""
+    line_bytes = estimate_line_bytes(csv_path, data_start, sample_bytes, zip_path)
+    return max(int(line_bytes * chunksize), sample_bytes)
+
+
+class AdaptiveChunkSizer:
+    """
+    Picks the size of the next block from the throughput and memory of the last one.
+    
+    Starts at min_rows and hill-climbs: the size keeps doubling while rows/sec
+    improves, and holds when the change is within `tolerance`. When throughput
+    drops the climb turns around and takes one step back, to the size before;
+    from then on it only moves (again one step, reversing each time) when
+    throughput drops, since an improvement after stepping back only shows the
+    size it left was worse. Whenever the process RSS exceeds the memory budget
+    the size is halved regardless, and it is never grown above 80% of the budget.
+    Sizes are kept in rows and converted to bytes with the observed line length.
+    """
+    
+    def __init__(self, line_bytes, min_rows=ADAPTIVE_MIN_ROWS, max_rows=ADAPTIVE_MAX_ROWS,
+                 memory_budget_mb=LOAD_MEMORY_BUDGET_MB, tolerance=0.05, label=None):
+        self.line_bytes = line_bytes
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.memory_budget_mb = memory_budget_mb
+        self.tolerance = tolerance
+        self.prefix = f"{label}: " if label else ""
+        self.rows = min_rows
+        self.growing = True  # direction of the climb, reversed when throughput drops
+        self.stepped_back = False  # throughput dropped once, stop climbing on improvements
+        self.last_rate = None
+        self.sizes_used = {}
+    
+    @property
+    def block_bytes(self):
+        return max(int(self.rows * self.line_bytes), 1)
+    
+    def observe(self, rows, size, seconds):
+        """Record one shipped block and choose the size of the next one."""
+        if rows == 0:
+            return
+        self.line_bytes = size / rows
+        self.sizes_used[self.rows] = self.sizes_used.get(self.rows, 0) + 1
+        rate = rows / seconds if seconds > 0 else float('inf')
+        rss_mb = psutil.Process().memory_info().rss / (1024 * 1024)
         
-        logger.info(f"Successfully loaded {rows_loaded:,} rows to {table_name}")
-        return rows_loaded
+        if rss_mb > self.memory_budget_mb:
+            step, reason = 0.5, "RSS over budget"
+        elif self.last_rate is None or rate > self.last_rate * (1 + self.tolerance):
+            step, reason = (1 if self.stepped_back else 2 if self.growing else 0.5), "throughput improved"
+        elif rate < self.last_rate * (1 - self.tolerance):
+            self.growing = not self.growing
+            self.stepped_back = True
+            step, reason = 2 if self.growing else 0.5, "throughput dropped"
+        else:
+            step, reason = 1, "throughput stable"
+        if step > 1 and rss_mb > self.memory_budget_mb * 0.8:
+            step, reason = 1, "RSS near budget"
+        self.last_rate = rate
         
-    except Exception as e:
-        logger.error(f"Failed to load {csv_path}: {e}")
+        new_rows = int(min(max(self.rows * step, self.min_rows), self.max_rows))
+        if new_rows != self.rows:
+            logger.info(f"{self.prefix}Chunk size {self.rows:,} -> {new_rows:,} rows ({reason}: "
+                        f"{rate:,.0f} rows/sec, RSS {rss_mb:,.0f} MB of {self.memory_budget_mb:,} MB budget)")
+            self.rows = new_rows
+    
+    def summary(self):
+        """Rows per block and how many blocks were shipped at each size."""
+        return ", ".join(f"{rows:,} rows x {count}" for rows, count in sorted(self.sizes_used.items()))
+
+
+def split_byte_ranges(csv_path, num_ranges, data_start, zip_path=None, end=None):
+    """
+    Split the data section of a CSV file into byte ranges aligned to line starts.
+    
+    Args:
+        csv_path: Path to the CSV file
+        num_ranges: Number of ranges wanted
+        data_start: Offset of the first data row (just after the header), or any line start
+        end: Line-aligned offset to stop at (defaults to the file size)
+    
+    Returns:
+        List of (start, end) offsets covering [data_start, end) with no gaps
+    """
+    file_size = csv_size(csv_path, zip_path) if end is None else end
+    boundaries = [data_start]
+    with open_csv(csv_path, zip_path) as f:
+        for k in range(1, num_ranges):
+            target = data_start + (file_size - data_start) * k // num_ranges
+            # Move to the start of the line after the newline at or after target - 1
+            f.seek(max(target - 1, data_start))
+            f.readline()
+            boundary = min(f.tell(), file_size)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if file_size > boundaries[-1]:
+        boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def iter_csv_blocks(f, start, end, block_bytes):
+    """
+    Yield (offset, bytes) blocks of whole lines from an open binary file.
+    
+    Blocks are about block_bytes long (an int, or a callable asked before every
+    read) and never cross `end`, which must be a line start. Non-seekable
+    streams are read from where they are, which must be `start`.
+    """
+    if f.seekable():
+        f.seek(start)
+    position = start
+    while position < end:
+        size = block_bytes() if callable(block_bytes) else block_bytes
+        block = f.read(min(size, end - position))
+        if not block:
+            break
+        if not block.endswith(b'\n') and position + len(block) < end:
+            block += f.readline()  # finish the last partial line
+        yield position, block
+        position += len(block)
+
+
+def check_parse_engine(parse_engine):
+    """Fail early if the requested parse engine is unknown or not installed."""
+    if parse_engine not in PARSE_ENGINES:
+        raise ValueError(f"Unknown parse engine: {parse_engine} (expected one of {PARSE_ENGINES})")
+    if parse_engine == "pyarrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("PARSE_ENGINE = 'pyarrow' requires the pyarrow package (pip install pyarrow)")
+
+
+def parse_csv_block(block, table_name, parse_engine="c"):
+    """Parse a headerless block of CSV lines into a DataFrame with the table's declared dtypes."""
+    dtypes = STAGING_DTYPES[table_name]
+    if parse_engine == "numpy":
+        columns = parse_ratings_block(block)
+        if columns is not None:
+            return derive_columns(pd.DataFrame(columns, copy=False), table_name)
+        logger.warning(f"Block of {len(block):,} bytes doesn't match the ratings layout, "
+                       f"parsing it with the c parser")
+        parse_engine = "c"
+    chunk = pd.read_csv(io.BytesIO(block), header=None, names=list(dtypes), dtype=dtypes,
+                        engine=parse_engine)
+    return derive_columns(chunk, table_name)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_byte_range(connection, csv_path, table_name, start, end, block_bytes, binary=False, label=None,
+                    freeze=False, parse_engine="c", zip_path=None, commit=True, queue_depth=LOAD_QUEUE_DEPTH,
+                    ledger_key=None, stream=None):
+    """
+    Parse and COPY one byte range of a CSV file.
+    
+    With queue_depth > 0, parsing runs in a background thread that hands encoded
+    blocks to this thread over a queue of at most queue_depth blocks, so the next
+    block is parsed while the current one is being copied. queue_depth=0 parses
+    and copies in turn.
+    
+    Every block is committed on its own unless commit=False, in which case the
+    caller owns the transaction (required with freeze=True). With a ledger_key,
+    each block is also recorded in the ledger in the same transaction as its data.
+    
+    Args:
+        connection: Raw psycopg2 connection
+        csv_path: Path to the CSV file
+        table_name: Name of the (already created) staging table
+        start, end: Line-aligned byte offsets of the range
+        block_bytes: Approximate bytes parsed and shipped per block, or an
+            AdaptiveChunkSizer that picks the size of every block
+        binary: Use binary COPY instead of text COPY
+        label: Prefix for progress messages (e.g. the worker number)
+        freeze: COPY with FREEZE (the table must be created in the open transaction)
+        parse_engine: pandas CSV engine, "c" or "pyarrow", or "numpy" to parse
+            blocks of a memory-mapped ratings file
+        zip_path: Optional zip archive containing csv_path
+        commit: Commit after every block
+        queue_depth: Parsed blocks that may wait for the database (0 = no parser thread)
+        ledger_key: (source, fingerprint) to record blocks under, or None for no ledger
+        stream: Already open binary file positioned at `start` to read instead of
+            opening csv_path (may be forward-only, e.g. a zip member still downloading)
+    
+    Returns:
+        Number of rows loaded from the range
+    """
+    prefix = f"{label}: " if label else ""
+    sizer = block_bytes if isinstance(block_bytes, AdaptiveChunkSizer) else None
+    if sizer:
+        sizer.prefix = prefix
+        block_bytes = lambda: sizer.block_bytes  # noqa: E731
+    timings = dict.fromkeys(("parse", "parse_wait", "load_wait", "db"), 0.0)
+    if end < sys.maxsize:
+        progress = ProgressReporter(end - start, label=f"{label or table_name} bytes {start:,}-{end:,}")
+    else:
+        progress = ProgressReporter(None, label=label or table_name)  # stream of unknown length
+    wall_start = time.perf_counter()
+    rows_loaded = 0
+    with (nullcontext(stream) if stream else open_csv(csv_path, zip_path)) as f:
+        if parse_engine == "numpy":
+            raw_blocks = iter_mmap_blocks(csv_path, start, end, block_bytes)
+        else:
+            raw_blocks = iter_csv_blocks(f, start, end, block_bytes)
+        blocks = _parse_blocks(raw_blocks, table_name, binary, parse_engine, prefix, timings)
+        if queue_depth > 0:
+            blocks = prefetch(blocks, queue_depth, timings)
+        with closing(blocks):
+            block_start = time.perf_counter()
+            for offset, size, rows, payload, keys, profile in blocks:
+                db_start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    copy_payload(cursor, payload, table_name, binary=binary, freeze=freeze)
+                    if ledger_key:
+                        record_block(cursor, table_name, ledger_key, start, offset, offset + size,
+                                     rows_loaded, rows_loaded + rows, keys, profile)
+                if commit:
+                    connection.commit()
+                timings['db'] += time.perf_counter() - db_start
+                if sizer:
+                    # Throughput of the whole pipeline: time between consecutive shipped blocks
+                    sizer.observe(rows, size, time.perf_counter() - block_start)
+                block_start = time.perf_counter()
+                
+                rows_loaded += rows
+                progress.update(offset + size - start, f"{rows_loaded:,} rows")
+    
+    wall = time.perf_counter() - wall_start
+    logger.info(f"{prefix}Stage times over {wall:.2f}s wall: parse {timings['parse']:.2f}s, "
+                f"parser blocked on full queue {timings['parse_wait']:.2f}s, "
+                f"loader waiting for blocks {timings['load_wait']:.2f}s, database {timings['db']:.2f}s "
+                f"(queue_depth={queue_depth})")
+    if sizer:
+        logger.info(f"{prefix}Chunk sizes used: {sizer.summary()}")
+    return rows_loaded
+
+
+def _parse_blocks(raw_blocks, table_name, binary, parse_engine, prefix, timings):
+    """Yield (offset, size, rows, COPY payload, key order, profile) for each (offset, block) of a byte range."""
+    for offset, block in raw_blocks:
+        parse_start = time.perf_counter()
+        chunk = parse_csv_block(block, table_name, parse_engine)
+        payload = encode_chunk(chunk, table_name, binary=binary)
+        keys = key_order(chunk, table_name)
+        profile = profile_block(chunk, table_name)
+        parse_seconds = time.perf_counter() - parse_start
+        timings['parse'] += parse_seconds
+        logger.info(f"{prefix}Parsed {len(chunk):,} rows in {parse_seconds:.3f}s "
+                    f"({chunk.memory_usage(deep=True).sum() / (1024*1024):.1f} MB in memory, "
+                    f"peak RSS {peak_rss_mb():,.0f} MB)")
+        yield offset, len(block), len(chunk), payload, keys, profile
+
+
+class _ProducerError:
+    """Wraps an exception raised in the prefetch thread so it can be re-raised by the consumer."""
+    
+    def __init__(self, error):
+        self.error = error
+
+
+_END_OF_BLOCKS = object()
+
+
+def prefetch(items, depth, timings):
+    """
+    Iterate `items` in a background thread, handing them over a bounded queue.
+    
+    Memory is capped at `depth` items waiting in the queue. Time the producer
+    spends blocked on a full queue is added to timings['parse_wait'] and time the
+    consumer spends waiting on an empty one to timings['load_wait'].
+    """
+    handoff = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    
+    def put(item):
+        wait_start = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    handoff.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            timings['parse_wait'] += time.perf_counter() - wait_start
+    
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(_END_OF_BLOCKS)
+        except BaseException as e:
+            put(_ProducerError(e))
+    
+    thread = threading.Thread(target=produce, name="csv-parser", daemon=True)
+    thread.start()
+    try:
+        while True:
+            wait_start = time.perf_counter()
+            item = handoff.get()
+            timings['load_wait'] += time.perf_counter() - wait_start
+            if item is _END_OF_BLOCKS:
+                return
+            if isinstance(item, _ProducerError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _load_range_worker(database_url, csv_path, table_name, start, end, block_bytes, binary, parse_engine,
+                       ledger_key, worker_id):
+    """Process pool entry point: load one byte range over a fresh connection to database_url."""
+    engine = create_engine(database_url)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            apply_session_settings(cursor)
+        return load_byte_range(connection, csv_path, table_name, start, end, block_bytes,
+                               binary=binary, label=f"Worker {worker_id}", parse_engine=parse_engine,
+                               ledger_key=ledger_key)
+    except Exception:
+        connection.rollback()
         raise
+    finally:
+        connection.close()
+        engine.dispose()
+
+
+def _load_with_copy(engine, csv_path, table_name, chunksize, binary=False, workers=1,
+                    table_mode="logged", parse_engine="c", zip_path=None, incremental=False, adaptive=False):
+    """
+    Create the table up front, then COPY the file over raw psycopg2 connections.
+    
+    With workers > 1 the data rows are split into newline-aligned byte ranges and
+    each range is parsed and loaded by its own process over its own connection.
+    In freeze mode the table is created and filled in a single transaction, so
+    the load always runs serially.
+    
+    Every committed block is recorded in the chunk ledger. If the previous load
+    of the table died part way, this one continues from the committed blocks
+    instead of starting again.
+    
+    With incremental=True and a valid watermark, only the bytes past the
+    watermark are appended to the existing table, in one transaction together
+    with the new watermark.
+    """
+    expected = [name for name, _ in STAGING_TABLES[table_name]]
+    columns, data_start = read_csv_header(csv_path, zip_path)
+    if columns != expected:
+        raise ValueError(f"Unexpected columns in {csv_path}: {columns} (expected {expected})")
+    if adaptive:
+        # Each worker gets its own copy of the sizer
+        block_bytes = AdaptiveChunkSizer(estimate_line_bytes(csv_path, data_start, zip_path=zip_path))
+        logger.info(f"Adaptive chunk sizing: {ADAPTIVE_MIN_ROWS:,}-{ADAPTIVE_MAX_ROWS:,} rows, "
+                    f"{LOAD_MEMORY_BUDGET_MB:,} MB memory budget per process")
+    else:
+        block_bytes = estimate_block_bytes(csv_path, data_start, chunksize, zip_path=zip_path)
+    file_size = csv_size(csv_path, zip_path)
+    source = f"{os.path.abspath(zip_path)}:{csv_path}" if zip_path else os.path.abspath(csv_path)
+    fingerprint = source_fingerprint(csv_path, file_size, zip_path)
+    ledger_key = (source, fingerprint)
+    
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            apply_session_settings(cursor)
+            wal_start = current_wal_lsn(cursor)
+            ensure_watermark_table(cursor)
+            ensure_ledger_table(cursor)
+            resume = find_resume_ranges(cursor, table_name, ledger_key, data_start, file_size)
+            append = None
+            if resume is None:
+                if incremental:
+                    append = find_append_offset(cursor, table_name, source, csv_path, file_size, zip_path)
+                clear_ledger(cursor, table_name)
+        connection.commit()
+        
+        if resume:
+            ranges, base_rows = resume
+            ledger_start = data_start
+            if len(ranges) == 1 and workers > 1:
+                ranges = split_byte_ranges(csv_path, workers, ranges[0][0], zip_path, end=ranges[0][1])
+            rows_loaded = _load_ranges(engine, connection, csv_path, table_name, ranges, block_bytes, binary,
+                                       parse_engine, zip_path, ledger_key, workers)
+        elif append and append[0] >= file_size:
+            ledger_start, base_rows = append
+            rows_loaded = 0
+            logger.info(f"Nothing was appended to {csv_path}, {table_name} is up to date")
+        elif append:
+            ledger_start, base_rows = append
+            rows_loaded = load_byte_range(connection, csv_path, table_name, ledger_start, file_size,
+                                          block_bytes, binary=binary, parse_engine=parse_engine,
+                                          zip_path=zip_path, commit=False, ledger_key=ledger_key)
+        else:
+            ledger_start, base_rows = data_start, 0
+            rows_loaded = _full_load(engine, connection, csv_path, table_name, data_start, block_bytes,
+                                     binary, workers, table_mode, parse_engine, zip_path, ledger_key)
+        
+        with connection.cursor() as cursor:
+            finalize_staging_table(cursor, table_name)
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            table_rows = cursor.fetchone()[0]
+            if table_rows != base_rows + rows_loaded:
+                raise RuntimeError(f"{table_name} has {table_rows:,} rows but {base_rows + rows_loaded:,} "
+                                   f"were loaded")
+            ledger_rows = rows_loaded + (base_rows if resume else 0)
+            complete_ledger(cursor, table_name, ledger_start, file_size, ledger_rows)
+            if incremental:
+                save_watermark(cursor, table_name, source, file_size, fingerprint, table_rows)
+        connection.commit()
+        
+        with connection.cursor() as cursor:
+            wal_bytes = wal_bytes_since(cursor, wal_start)
+        connection.commit()
+        logger.info(f"WAL generated while loading {table_name}: {wal_bytes / (1024*1024):,.1f} MB "
+                    f"(table_mode={table_mode}, server wide)")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    
+    logger.info(f"{table_name} now has {table_rows:,} rows")
+    return rows_loaded
+
+
+def _full_load(engine, connection, csv_path, table_name, data_start, block_bytes, binary, workers,
+               table_mode, parse_engine, zip_path, ledger_key):
+    """Recreate the staging table and load every data row of the file into it."""
+    freeze = table_mode == "freeze"
+    if freeze and workers > 1:
+        logger.info("COPY FREEZE needs a single transaction, loading serially")
+        workers = 1
+    ranges = split_byte_ranges(csv_path, max(workers, 1), data_start, zip_path)
+    
+    with connection.cursor() as cursor:
+        # A crash mid-load must not leave a watermark pointing into a half-built table
+        clear_watermark(cursor, table_name)
+        create_staging_table(cursor, table_name, unlogged=(table_mode == "unlogged"))
+    if not freeze:
+        connection.commit()
+    
+    return _load_ranges(engine, connection, csv_path, table_name, ranges, block_bytes, binary,
+                        parse_engine, zip_path, ledger_key, workers, freeze=freeze)
+
+
+def _load_ranges(engine, connection, csv_path, table_name, ranges, block_bytes, binary, parse_engine,
+                 zip_path, ledger_key, workers, freeze=False):
+    """Load byte ranges into an existing table, over up to `workers` processes."""
+    if workers > 1 and len(ranges) > 1:
+        return _load_ranges_in_parallel(engine, csv_path, table_name, ranges, block_bytes, binary,
+                                        parse_engine, ledger_key, workers)
+    rows_loaded = 0
+    for start, end in ranges:
+        rows_loaded += load_byte_range(connection, csv_path, table_name, start, end, block_bytes,
+                                       binary=binary, freeze=freeze, parse_engine=parse_engine,
+                                       zip_path=zip_path, commit=not freeze, ledger_key=ledger_key)
+    return rows_loaded
+
+
+def _load_ranges_in_parallel(engine, csv_path, table_name, ranges, block_bytes, binary, parse_engine,
+                             ledger_key, workers):
+    """Load byte ranges concurrently, each range in a worker process with its own connection."""
+    logger.info(f"Loading {len(ranges)} byte ranges over {min(workers, len(ranges))} processes")
+    # Pooled connections must not be shared with forked workers, they connect to the engine's database themselves
+    engine.dispose()
+    database_url = engine.url.render_as_string(hide_password=False)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        futures = [
+            pool.submit(_load_range_worker, database_url, csv_path, table_name, start, end, block_bytes, binary,
+                        parse_engine, ledger_key, i)
+            for i, (start, end) in enumerate(ranges, 1)
+        ]
+        rows_per_worker = [future.result() for future in futures]
+    for i, rows in enumerate(rows_per_worker, 1):
+        logger.info(f"Range {i} loaded {rows:,} rows")
+    return sum(rows_per_worker)
+
+
+def load_stream_to_staging(engine, stream, table_name, size=None, chunksize=LOAD_CHUNKSIZE, method=LOAD_METHOD,
+                           table_mode=STAGING_TABLE_MODE, parse_engine=PARSE_ENGINE, adaptive=ADAPTIVE_CHUNKSIZE,
+                           source=None):
+    """
+    Load a CSV from a forward-only binary stream, e.g. a zip member decompressed while it downloads.
+    
+    Blocks are parsed in the background parser thread as the stream delivers them
+    and COPY'd as they are ready. Without seeking there are no byte ranges,
+    resume or append: the table is always rebuilt, and its watermark and ledger
+    are cleared.
+    
+    Args:
+        engine: SQLAlchemy engine
+        stream: Binary file object positioned at the CSV header
+        table_name: Name of the staging table
+        size: Uncompressed size of the CSV in bytes, if known (for progress)
+        chunksize, method, table_mode, parse_engine, adaptive: As for load_csv_to_staging
+            (to_sql is not supported, the numpy parser falls back to "c")
+        source: Name of the stream for log messages
+    
+    Returns:
+        Number of rows loaded
+    """
+    source = source or table_name
+    if method == "to_sql":
+        raise ValueError("Streaming loads need a COPY method")
+    binary = method == "binary" and supports_binary_copy(table_name)
+    if parse_engine == "numpy":
+        parse_engine = "c"  # the numpy parser memory-maps a file on disk
+    check_parse_engine(parse_engine)
+    
+    expected = [name for name, _ in STAGING_TABLES[table_name]]
+    header = stream.readline()
+    columns = header.decode('utf-8').strip().split(',')
+    if columns != expected:
+        raise ValueError(f"Unexpected columns in {source}: {columns} (expected {expected})")
+    data_start = len(header)
+    end = data_start + size if size is not None else sys.maxsize
+    sample = stream.peek(65536)
+    line_bytes = len(sample) / (sample.count(b'\n') or 1)
+    block_bytes = AdaptiveChunkSizer(line_bytes) if adaptive else max(int(chunksize * line_bytes), 1)
+    freeze = table_mode == "freeze"
+    
+    logger.info(f"Streaming {source} to {table_name} (method={method}, table_mode={table_mode})")
+    start_time = time.perf_counter()
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            apply_session_settings(cursor)
+            ensure_watermark_table(cursor)
+            ensure_ledger_table(cursor)
+            clear_watermark(cursor, table_name)
+            clear_ledger(cursor, table_name)
+            create_staging_table(cursor, table_name, unlogged=(table_mode == "unlogged"))
+        if not freeze:
+            connection.commit()
+        
+        rows_loaded = load_byte_range(connection, None, table_name, data_start, end, block_bytes,
+                                      binary=binary, label=table_name, freeze=freeze,
+                                      parse_engine=parse_engine, commit=not freeze, stream=stream)
+        
+        with connection.cursor() as cursor:
+            finalize_staging_table(cursor, table_name)
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+            table_rows = cursor.fetchone()[0]
+        if table_rows != rows_loaded:
+            raise RuntimeError(f"{table_name} has {table_rows:,} rows but {rows_loaded:,} were loaded")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    
+    elapsed = time.perf_counter() - start_time
+    rate = rows_loaded / elapsed if elapsed > 0 else 0
+    logger.info(f"Successfully loaded {rows_loaded:,} rows to {table_name} "
+                f"in {elapsed:.2f}s ({rate:,.0f} rows/sec, streamed)")
+    return rows_loaded
 
 
 def verify_staging_tables(engine):
@@ -113,19 +1527,39 @@ def main():
     # Create database connection
     engine = create_engine_connection()
     
-    # Define file paths
-    movies_path = os.path.join(DATA_RAW_PATH, "ml-32m", "movies.csv")
-    ratings_path = os.path.join(DATA_RAW_PATH, "ml-32m", "ratings.csv")
+    # Define file paths: stream straight out of the archive when it's there,
+    # otherwise read the extracted CSVs
+    zip_path = os.path.join(DATA_RAW_PATH, ZIP_FILENAME)
+    if LOAD_FROM_ZIP and os.path.exists(zip_path):
+        logger.info(f"Reading CSVs directly from {zip_path}")
+        movies_path, ratings_path = "ml-32m/movies.csv", "ml-32m/ratings.csv"
+    else:
+        zip_path = None
+        movies_path = os.path.join(DATA_RAW_PATH, "ml-32m", "movies.csv")
+        ratings_path = os.path.join(DATA_RAW_PATH, "ml-32m", "ratings.csv")
     
     # Load movies to staging
     logger.info("-" * 30)
     logger.info("Loading movies...")
-    movies_rows = load_csv_to_staging(engine, movies_path, "staging_movies")
+    movies_rows = load_csv_to_staging(engine, movies_path, "staging_movies", zip_path=zip_path)
     
     # Load ratings to staging (this is a large file)
     logger.info("-" * 30)
     logger.info("Loading ratings (this may take a few minutes)...")
-    ratings_rows = load_csv_to_staging(engine, ratings_path, "staging_ratings")
+    ratings_rows = load_csv_to_staging(engine, ratings_path, "staging_ratings", zip_path=zip_path)
+    
+    # Columnar copy of ratings for the later tasks; they query the database without it.
+    # A cache of other ratings than the ones just loaded is removed rather than left for them to read.
+    if WRITE_RATINGS_CACHE:
+        logger.info("-" * 30)
+        logger.info("Writing ratings cache...")
+        try:
+            build_ratings_cache(ratings_path, RATINGS_CACHE_PATH, zip_path=zip_path)
+        except Exception as e:
+            logger.warning(f"Could not write ratings cache: {e}")
+            remove_ratings_cache(RATINGS_CACHE_PATH)
+    else:
+        discard_stale_cache(RATINGS_CACHE_PATH, ratings_path, zip_path=zip_path)
     
     # Verify the data was loaded
     logger.info("-" * 30)
@@ -0,0 +1,38 @@
+"""
+Vectorized parsing of MovieLens titles such as "Toy Story (1995)".
+One compiled regex over the whole title column splits off the release year,
+giving exactly what transform_data.py's SQL expressions give:
+
+    release_year: the four digits in parentheses that end the title, else NULL
+    clean_title:  the title without them and the whitespace before them,
+                  with leading/trailing spaces trimmed (the whole title, trimmed,
+                  when there is no year)
+"""
+
+import re
+import pandas as pd
+
+# PostgreSQL's \s is [[:space:]] (ASCII whitespace) and its $ only matches at the very
+# end of the string, hence the explicit class and \Z. The lazy prefix makes the match
+# start where REGEXP_REPLACE's leftmost match of '\s*\([0-9]{4}\)$' would.
+TITLE_YEAR = re.compile(r'\A(?P<clean_title>.*?)[ \t\n\r\f\v]*\((?P<release_year>[0-9]{4})\)\Z', re.DOTALL)
+
+
+def parse_titles(titles):
+    """
+    Split titles into release year and clean title.
+
+    Args:
+        titles: Series of titles (missing values give missing results)
+
+    Returns:
+        DataFrame with release_year (Int32) and clean_title (string), on the same index
+    """
+    titles = titles.astype("string")
+    parts = titles.str.extract(TITLE_YEAR)
+    matched = parts["release_year"].notna()
+    return pd.DataFrame({
+        "release_year": parts["release_year"].astype("Int32"),
+        # TRIM() only strips spaces
+        "clean_title": parts["clean_title"].where(matched, titles).str.strip(" "),
+    }, index=titles.index)
@@ -0,0 +1,86 @@
+"""
+Progress and ETA reporting shared by the pipeline tasks.
+Reports how far a long step has got from work already done (bytes read,
+statements run) so no extra pass over the data is needed up front.
+"""
+
+import time
+import logging
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def format_amount(amount, unit):
+    """Format an amount for log messages (bytes are shown in MB)."""
+    if unit == "bytes":
+        return f"{amount / (1024*1024):,.1f} MB"
+    return f"{amount:,.0f} {unit}"
+
+
+def format_rate(rate, unit):
+    """Format a throughput for log messages."""
+    if unit == "bytes":
+        return f"{rate / (1024*1024):,.1f} MB/s"
+    return f"{rate:,.2f} {unit}/s"
+
+
+class ProgressReporter:
+    """
+    Log percentage done, throughput and ETA of a step with a known total.
+
+    Example:
+        progress = ProgressReporter(os.path.getsize(path), label="ratings.csv")
+        progress.update(bytes_read, f"{rows:,} rows")
+    """
+
+    def __init__(self, total, label="Progress", unit="bytes", min_interval=0.0, start=0):
+        """
+        Args:
+            total: Amount of work in the step (bytes, statements, ...), or None if
+                unknown (only the amount done and throughput are logged)
+            label: Prefix of every progress message
+            unit: Unit of total, "bytes" is formatted as MB
+            min_interval: Minimum seconds between two messages (the last one is always logged)
+            start: Amount already done before this reporter was created (e.g. a resumed load)
+        """
+        self.total = total
+        self.label = label
+        self.unit = unit
+        self.min_interval = min_interval
+        self.start = start
+        self.done = start
+        self.start_time = time.perf_counter()
+        self.last_log = None
+
+    def update(self, done, detail=None):
+        """Set the amount done so far and log progress."""
+        self.done = done
+        now = time.perf_counter()
+        finished = self.total is not None and done >= self.total
+        if not finished and self.last_log is not None and now - self.last_log < self.min_interval:
+            return
+        self.last_log = now
+
+        elapsed = now - self.start_time
+        rate = (done - self.start) / elapsed if elapsed > 0 else 0
+        if self.total is None:
+            message = f"{self.label}: {format_amount(done, self.unit)}, {format_rate(rate, self.unit)}"
+            logger.info(f"{message} - {detail}" if detail else message)
+            return
+        percent = done / self.total * 100 if self.total else 100.0
+        if finished:
+            eta = "done"
+        elif rate > 0:
+            eta = f"ETA {timedelta(seconds=round((self.total - done) / rate))}"
+        else:
+            eta = "ETA unknown"
+        message = (f"{self.label}: {percent:.1f}% ({format_amount(done, self.unit)} / "
+                   f"{format_amount(self.total, self.unit)}), {format_rate(rate, self.unit)}, {eta}")
+        if detail:
+            message += f" - {detail}"
+        logger.info(message)
+
+    def advance(self, amount=1, detail=None):
+        """Add `amount` to the work done and log progress."""
+        self.update(self.done + amount, detail)
@@ -0,0 +1,250 @@
+"""
+Columnar cache of ratings.csv.
+Writes one .npy file per ratings column plus a manifest.json recording which
+version of the source it was built from, so later stages (and ad hoc analysis) can open
+the 32M ratings zero-copy with np.load(mmap_mode='r') instead of re-parsing
+the CSV or querying PostgreSQL.
+
+Example:
+    ratings = open_ratings_cache()
+    if ratings is not None:
+        print(ratings["rating"].mean())
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from ratings_reader import RATINGS_COLUMNS, iter_mmap_blocks, parse_ratings_block
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+CACHE_DTYPES = {
+    "userId": np.int32,
+    "movieId": np.int32,
+    "rating": np.float32,
+    "timestamp": np.int64,
+}
+SCAN_BYTES = 8 * 1024 * 1024
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def _open_source(csv_path, zip_path=None):
+    """Open ratings.csv for binary reading, from disk or as a zip member."""
+    if zip_path is None:
+        return open(csv_path, 'rb')
+    with zipfile.ZipFile(zip_path) as archive:
+        # The member keeps the archive file open until it is closed itself
+        return archive.open(csv_path)
+
+
+def source_key(csv_path, zip_path=None):
+    """
+    Identify the version of the source without reading it.
+
+    A zip member is identified by the CRC-32, size and date in the archive's
+    central directory, a file on disk by its size and modification time.
+    """
+    if zip_path is None:
+        stat = os.stat(csv_path)
+        return f"file:{stat.st_size}:{stat.st_mtime_ns}"
+    with zipfile.ZipFile(zip_path) as archive:
+        info = archive.getinfo(csv_path)
+    return f"zip:{info.CRC:08x}:{info.file_size}:{'-'.join(map(str, info.date_time))}"
+
+
+def scan_source(csv_path, zip_path=None):
+    """
+    Read the source once to get its SHA-256, size, header length and data row count.
+
+    Returns:
+        dict with sha256, bytes, header_bytes and rows
+    """
+    digest = hashlib.sha256()
+    size = 0
+    newlines = 0
+    last = b''
+    with _open_source(csv_path, zip_path) as f:
+        header = f.readline()
+        digest.update(header)
+        while True:
+            buffer = f.read(SCAN_BYTES)
+            if not buffer:
+                break
+            digest.update(buffer)
+            size += len(buffer)
+            newlines += buffer.count(b'\n')
+            last = buffer[-1:]
+    rows = newlines + (1 if last not in (b'', b'\n') else 0)
+    return {
+        'sha256': digest.hexdigest(),
+        'bytes': len(header) + size,
+        'header_bytes': len(header),
+        'rows': rows,
+    }
+
+
+def read_manifest(cache_dir):
+    """Return the cache manifest, or None if there is no complete cache in cache_dir."""
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _parse_block(block):
+    """Parse whole ratings lines into column arrays, falling back to pandas for odd lines."""
+    columns = parse_ratings_block(block)
+    if columns is None:
+        chunk = pd.read_csv(io.BytesIO(block), header=None, names=RATINGS_COLUMNS, dtype=CACHE_DTYPES)
+        columns = {name: chunk[name].to_numpy() for name in RATINGS_COLUMNS}
+    return columns
+
+
+def _iter_source_blocks(csv_path, zip_path, start, end):
+    """Yield blocks of whole data lines, memory-mapped from disk or read out of the zip."""
+    if zip_path is None:
+        for _, block in iter_mmap_blocks(csv_path, start, end, BLOCK_BYTES):
+            yield block
+        return
+    with _open_source(csv_path, zip_path) as f:
+        f.readline()
+        while True:
+            block = f.read(BLOCK_BYTES)
+            if not block:
+                break
+            if not block.endswith(b'\n'):
+                block += f.readline()
+            yield block
+
+
+def build_ratings_cache(csv_path, cache_dir, zip_path=None, force=False):
+    """
+    Write the columnar cache for ratings.csv unless an up-to-date one exists.
+
+    Whether the cache is up to date is decided on source_key(), so a current
+    cache costs no pass over the source. The cache is written to a temporary directory next to cache_dir and swapped
+    in once complete, so readers never see a half-written cache.
+
+    Args:
+        csv_path: Path to ratings.csv, or its member name when zip_path is given
+        cache_dir: Directory holding the .npy files and manifest
+        zip_path: Optional zip archive containing csv_path
+        force: Rebuild even if the manifest matches the source version
+
+    Returns:
+        The manifest of the cache
+    """
+    source = f"{zip_path}:{csv_path}" if zip_path else csv_path
+    start = time.perf_counter()
+    key = source_key(csv_path, zip_path)
+    manifest = read_manifest(cache_dir)
+    if not force and manifest and manifest.get('source_key') == key:
+        logger.info(f"Ratings cache in {cache_dir} is up to date with {source} ({key}), not rebuilding")
+        return manifest
+
+    scan = scan_source(csv_path, zip_path)
+
+    logger.info(f"Building ratings cache for {source} ({scan['rows']:,} rows) in {cache_dir}")
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        arrays = {
+            name: np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode='w+',
+                                            dtype=dtype, shape=(scan['rows'],))
+            for name, dtype in CACHE_DTYPES.items()
+        }
+        row = 0
+        for block in _iter_source_blocks(csv_path, zip_path, scan['header_bytes'], scan['bytes']):
+            columns = _parse_block(block)
+            rows = len(columns['userId'])
+            for name, array in arrays.items():
+                array[row:row + rows] = columns[name]
+            row += rows
+        if row != scan['rows']:
+            raise ValueError(f"Parsed {row:,} rows from {source}, expected {scan['rows']:,}")
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+        manifest = {
+            'source': source,
+            'source_key': key,
+            'sha256': scan['sha256'],
+            'source_bytes': scan['bytes'],
+            'rows': row,
+            'columns': {name: {'file': f"{name}.npy", 'dtype': np.dtype(dtype).name}
+                        for name, dtype in CACHE_DTYPES.items()},
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        old_dir = f"{cache_dir}.old-{os.getpid()}"
+        if os.path.exists(cache_dir):
+            os.rename(cache_dir, old_dir)
+        os.rename(tmp_dir, cache_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Ratings cache written: {row:,} rows in {time.perf_counter() - start:.2f}s")
+    return manifest
+
+
+def remove_ratings_cache(cache_dir):
+    """Delete the cache, e.g. when it could not be rebuilt for a new source and would be stale."""
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        logger.info(f"Removed ratings cache in {cache_dir}")
+
+
+def discard_stale_cache(cache_dir, csv_path, zip_path=None):
+    """Remove the cache unless it was built from the current version of the source."""
+    manifest = read_manifest(cache_dir)
+    if manifest is not None and manifest.get('source_key') != source_key(csv_path, zip_path):
+        logger.info(f"Ratings cache in {cache_dir} was built from another source version")
+        remove_ratings_cache(cache_dir)
+
+
+def open_ratings_cache(cache_dir, sha256=None):
+    """
+    Open the cached ratings columns as read-only memory maps.
+
+    Args:
+        cache_dir: Directory holding the .npy files and manifest
+        sha256: Only accept a cache built from a source with this checksum
+
+    Returns:
+        dict of column name -> read-only memmapped array, or None when the cache
+        is missing, stale or incomplete
+    """
+    manifest = read_manifest(cache_dir)
+    if manifest is None:
+        logger.info(f"No ratings cache in {cache_dir}")
+        return None
+    if sha256 is not None and manifest['sha256'] != sha256:
+        logger.info(f"Ratings cache in {cache_dir} was built from another source version")
+        return None
+    try:
+        columns = {name: np.load(os.path.join(cache_dir, column['file']), mmap_mode='r')
+                   for name, column in manifest['columns'].items()}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ratings cache in {cache_dir} is unreadable: {e}")
+        return None
+    if any(len(array) != manifest['rows'] for array in columns.values()):
+        logger.warning(f"Ratings cache in {cache_dir} doesn't match its manifest")
+        return None
+    return columns
@@ -0,0 +1,154 @@
+"""
+Vectorized reader for the MovieLens ratings.csv layout.
+Every line is "userId,movieId,rating,timestamp" with unsigned integers and a
+decimal rating, so the file can be memory-mapped and split on delimiters with
+NumPy byte operations instead of going through a general-purpose CSV parser.
+"""
+
+import numpy as np
+
+RATINGS_COLUMNS = ["userId", "movieId", "rating", "timestamp"]
+
+NEWLINE = ord('\n')
+COMMA = ord(',')
+DOT = ord('.')
+ZERO = ord('0')
+
+# Longest integer field that can't overflow int64
+MAX_DIGITS = 18
+
+
+def iter_mmap_blocks(csv_path, start, end, block_bytes):
+    """
+    Yield (offset, uint8 array) blocks of whole lines from a memory-mapped file.
+
+    The arrays are views on the map, nothing is copied until a block is parsed.
+
+    Args:
+        csv_path: Path to the CSV file
+        start, end: Line-aligned byte offsets to read between
+        block_bytes: Approximate block size (an int, or a callable asked before every block)
+    """
+    if end <= start:
+        return
+    data = np.memmap(csv_path, dtype=np.uint8, mode='r')
+    position = start
+    while position < end:
+        size = block_bytes() if callable(block_bytes) else block_bytes
+        stop = min(position + max(size, 1), end)
+        # Extend to the end of the line the block stops in
+        while stop < end and data[stop - 1] != NEWLINE:
+            window = data[stop:min(stop + 65536, end)]
+            newlines = np.flatnonzero(window == NEWLINE)
+            # Plain ints: the offsets end up in the ledger, and psycopg2 can't adapt NumPy integers
+            stop = stop + int(newlines[0]) + 1 if len(newlines) else stop + len(window)
+        yield position, data[position:stop]
+        position = stop
+
+
+def _parse_uint(data, starts, ends):
+    """
+    Parse unsigned integer fields data[starts[i]:ends[i]] all at once.
+
+    Works one digit position at a time across all rows (right-aligned), so the
+    loop runs once per digit of the widest field rather than once per row.
+
+    Returns:
+        int64 array, or None if a field is empty, too long or not all digits
+    """
+    lengths = ends - starts
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64)
+    width = int(lengths.max())
+    if width > MAX_DIGITS or lengths.min() < 1:
+        return None
+    values = np.zeros(len(starts), dtype=np.int64)
+    for k in range(width, 0, -1):
+        positions = ends - k
+        digits = data[positions] - np.uint8(ZERO)  # non-digits wrap around to > 9
+        if k > 1:
+            in_field = lengths >= k
+            digits = np.where(in_field, digits, 0)
+        if (digits > 9).any():
+            return None
+        values *= 10
+        values += digits
+    return values
+
+
+def _parse_decimal(data, starts, ends):
+    """Parse fields like "4", "4.5" or "0.25" into float64, or None if one is malformed."""
+    lengths = ends - starts
+    if len(lengths) == 0:
+        return np.zeros(0)
+    width = int(lengths.max())
+    if width > MAX_DIGITS or lengths.min() < 1:
+        return None
+    values = np.zeros(len(starts), dtype=np.int64)
+    decimals = np.zeros(len(starts), dtype=np.int64)
+    seen_dot = np.zeros(len(starts), dtype=bool)
+    for k in range(width):
+        in_field = lengths > k
+        chars = data[np.where(in_field, starts + k, 0)]
+        is_dot = (chars == DOT) & in_field
+        if (is_dot & seen_dot).any():
+            return None
+        digits = chars - np.uint8(ZERO)
+        is_digit = in_field & ~is_dot
+        if (digits[is_digit] > 9).any():
+            return None
+        values = np.where(is_digit, values * 10 + digits, values)
+        decimals += is_digit & seen_dot
+        seen_dot |= is_dot
+    if (data[starts] == DOT).any() or (data[ends - 1] == DOT).any():
+        return None
+    return values / 10.0 ** decimals
+
+
+def parse_ratings_block(block):
+    """
+    Parse a block of whole ratings.csv lines (no header) into typed column arrays.
+
+    Args:
+        block: bytes or uint8 array holding complete lines
+
+    Returns:
+        dict of userId (int32), movieId (int32), rating (float32) and timestamp
+        (int64) arrays, or None if any line doesn't match the layout so the
+        caller can fall back to a general-purpose parser
+    """
+    data = np.frombuffer(block, dtype=np.uint8) if isinstance(block, (bytes, bytearray)) else block
+    if len(data) == 0:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in
+                zip(RATINGS_COLUMNS, (np.int32, np.int32, np.float32, np.int64))}
+    if data[-1] != NEWLINE:
+        data = np.append(data, np.uint8(NEWLINE))
+
+    separators = np.flatnonzero((data == COMMA) | (data == NEWLINE))
+    is_newline = data[separators] == NEWLINE
+    num_lines = int(is_newline.sum())
+    # Exactly three commas then a newline on every line
+    if len(separators) != 4 * num_lines or not is_newline[3::4].all():
+        return None
+    ends = separators.reshape(num_lines, 4)
+    starts = np.empty_like(ends)
+    starts[0, 0] = 0
+    starts[1:, 0] = ends[:-1, 3] + 1
+    starts[:, 1:] = ends[:, :3] + 1
+
+    user_ids = _parse_uint(data, starts[:, 0], ends[:, 0])
+    movie_ids = _parse_uint(data, starts[:, 1], ends[:, 1])
+    ratings = _parse_decimal(data, starts[:, 2], ends[:, 2])
+    timestamps = _parse_uint(data, starts[:, 3], ends[:, 3])
+    if any(column is None for column in (user_ids, movie_ids, ratings, timestamps)):
+        return None
+    int32_max = np.iinfo(np.int32).max
+    if user_ids.max() > int32_max or movie_ids.max() > int32_max:
+        return None
+
+    return {
+        "userId": user_ids.astype(np.int32),
+        "movieId": movie_ids.astype(np.int32),
+        "rating": ratings.astype(np.float32),
+        "timestamp": timestamps,
+    }
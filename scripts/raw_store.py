@@ -0,0 +1,173 @@
+"""
+Content-addressed store for raw dataset files.
+Every file (an archive or a member extracted from it) is kept once under its
+SHA-256, and runs get hardlinks to it in their own working directory. Runs of
+the same dataset version, and different versions with identical files, share
+the bytes on disk, and an archive whose members are already in the store is
+never extracted again.
+
+Layout:
+    objects/ab/abcdef...        file contents, read-only, named by SHA-256
+    archives/<sha256>.json      members extracted from an archive and their SHA-256
+
+Every directory files are linked into gets a manifest (MANIFEST_NAME) of the
+objects it holds. An object that no kept directory's manifest lists and nothing
+outside the store hardlinks to (e.g. after its runs were pruned) is deleted by
+collect_garbage().
+"""
+
+import os
+import json
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Manifest of the stored files linked into a directory: {relative path: sha256}
+MANIFEST_NAME = "raw_store.json"
+
+
+class RawStore:
+    """A content-addressed file store rooted at one directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.archives = os.path.join(root, "archives")
+        self.tmp = os.path.join(root, "tmp")
+        for path in (self.objects, self.archives, self.tmp):
+            os.makedirs(path, exist_ok=True)
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def has(self, sha256):
+        return os.path.exists(self.object_path(sha256))
+
+    def add(self, path, sha256):
+        """
+        Put the file at `path` (whose SHA-256 the caller computed) into the store.
+
+        The file is hardlinked in, not copied. If the store already holds the same
+        content, `path` is replaced by a link to the stored copy instead, so the
+        duplicate's bytes are freed.
+
+        Returns:
+            Path of the stored object
+        """
+        target = self.object_path(sha256)
+        if os.path.exists(target):
+            if not os.path.samefile(path, target):
+                self.link(sha256, path)
+                logger.info(f"{os.path.basename(path)} is already stored as {sha256[:12]}, deduplicated")
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        staged = os.path.join(self.tmp, f"{sha256}.{os.getpid()}")
+        _link_or_copy(path, staged)
+        # Stored objects are shared by every run that links them, never edit one in place
+        os.chmod(staged, 0o444)
+        os.replace(staged, target)
+        logger.info(f"Stored {os.path.basename(path)} as {sha256[:12]}")
+        return target
+
+    def link(self, sha256, destination):
+        """Atomically make `destination` a hardlink to a stored object (a copy across filesystems)."""
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        # rename() onto another link to the same file is a no-op that would leave `staged` behind
+        if os.path.exists(destination) and os.path.samefile(destination, self.object_path(sha256)):
+            return destination
+        staged = f"{destination}.link-{os.getpid()}"
+        if os.path.lexists(staged):
+            os.remove(staged)
+        _link_or_copy(self.object_path(sha256), staged)
+        os.replace(staged, destination)
+        return destination
+
+    def read_archive(self, archive_sha256):
+        """Return {member name: {"sha256", "size"}} recorded for an archive, or None if not extracted yet."""
+        try:
+            with open(os.path.join(self.archives, f"{archive_sha256}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def write_archive(self, archive_sha256, members):
+        """Record the stored members of an archive (merged with any recorded before)."""
+        recorded = self.read_archive(archive_sha256) or {}
+        recorded.update(members)
+        path = os.path.join(self.archives, f"{archive_sha256}.json")
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(recorded, f, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def write_manifest(self, directory, files):
+        """Record the stored objects linked into `directory` ({relative path: sha256})."""
+        path = os.path.join(directory, MANIFEST_NAME)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(files, f, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def read_manifest(self, directory):
+        """Return {relative path: sha256} linked into `directory`, or {} if it has no manifest."""
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def collect_garbage(self, live_dirs=()):
+        """
+        Delete the objects no kept directory uses, and the records of collected archives.
+
+        An object is live if the manifest of one of `live_dirs` lists it. Links
+        may have fallen back to copies (across filesystems), so the link count
+        alone doesn't prove an object unused; an object with other hardlinks is
+        still kept, for directories linked without a manifest.
+        Call it while holding the lock that serializes writers to the store.
+
+        Args:
+            live_dirs: Directories whose manifests name the objects to keep
+
+        Returns:
+            (objects deleted, bytes freed)
+        """
+        live = set()
+        for directory in live_dirs:
+            live.update(self.read_manifest(directory).values())
+        removed, freed = 0, 0
+        for prefix in os.scandir(self.objects):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                stat = entry.stat(follow_symlinks=False)
+                if entry.name in live or stat.st_nlink > 1:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+                freed += stat.st_size
+        for entry in os.scandir(self.archives):
+            if entry.name.endswith(".json") and not self.has(entry.name[:-len(".json")]):
+                os.remove(entry.path)
+        if removed:
+            logger.info(f"Removed {removed} unreferenced object(s) from the raw store, "
+                        f"{freed / (1024*1024):,.1f} MB freed")
+        return removed, freed
+
+    def stored_members(self, archive_sha256, names):
+        """
+        Return the recorded members of an archive that are still in the store.
+
+        Returns:
+            {member name: sha256} for those of `names` that need no extraction
+        """
+        recorded = self.read_archive(archive_sha256) or {}
+        return {name: recorded[name]['sha256'] for name in names
+                if name in recorded and self.has(recorded[name]['sha256'])}
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError as e:
+        logger.warning(f"Can't hardlink {source} to {destination} ({e}), copying instead")
+        shutil.copyfile(source, destination)
@@ -5,6 +5,7 @@ Task 6: Run SQL analytics and save results as separate csv files
 
 import os
 import sys
+import numpy as np
 import pandas as pd
 import logging
 from sqlalchemy import create_engine, text
@@ -12,7 +13,8 @@ from datetime import datetime
 
 # Add parent directory to path so we can import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config.config import DATABASE_URL, DATA_OUTPUT_PATH, LOGS_PATH
+from config.config import DATABASE_URL, DATA_OUTPUT_PATH, LOGS_PATH, RATINGS_CACHE_PATH
+from ratings_cache import open_ratings_cache
 
 # Setup logging
 logging.basicConfig(
@@ -180,6 +182,40 @@ def least_5_genres_by_num_ratings(engine):
     )
 
 
+def rating_distribution_from_cache():
+    """
+    Task 6e: Number of ratings per rating value, from the columnar ratings cache.
+    Counts the raw source ratings with NumPy, no database query.
+    
+    Returns:
+        DataFrame with results, or None when there is no ratings cache
+    """
+    ratings = open_ratings_cache(RATINGS_CACHE_PATH)
+    if ratings is None:
+        logger.info("No ratings cache, skipping rating distribution")
+        return None
+    
+    logger.info("Running analysis: Rating distribution (source ratings)")
+    # Ratings are in 0.5 steps, so twice the rating is a small integer bin
+    counts = np.bincount(np.rint(ratings["rating"] * 2).astype(np.int64))
+    steps = np.flatnonzero(counts)
+    df = pd.DataFrame({
+        'rating': steps / 2,
+        'num_ratings': counts[steps],
+        'pct_ratings': np.round(counts[steps] / counts.sum() * 100, 2),
+    })
+    
+    os.makedirs(DATA_OUTPUT_PATH, exist_ok=True)
+    output_path = os.path.join(DATA_OUTPUT_PATH, "rating_distribution.csv")
+    df.to_csv(output_path, index=False)
+    
+    logger.info(f"Saved results to {output_path}")
+    logger.info("Results preview:")
+    logger.info(f"\n{df.to_string()}")
+    
+    return df
+
+
 def main():
     """Main function to run all analytics."""
     logger.info("=" * 50)
@@ -212,6 +248,11 @@ def main():
     logger.info("-" * 30)
     least_5_genres_by_num_ratings(engine)
     
+    logger.info("-" * 30)
+    logger.info("Analysis 6e: Rating Distribution (from ratings cache)")
+    logger.info("-" * 30)
+    rating_distribution_from_cache()
+    
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
     
@@ -223,6 +264,7 @@ def main():
     logger.info("  - least_10_movies_by_avg_rating.csv")
     logger.info("  - top_5_genres_by_num_ratings.csv")
     logger.info("  - least_5_genres_by_num_ratings.csv")
+    logger.info("  - rating_distribution.csv (when the ratings cache exists)")
 
 
 if __name__ == "__main__":
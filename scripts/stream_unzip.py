@@ -0,0 +1,225 @@
+"""
+Forward-only ZIP reader for archives that are still arriving.
+Parses the local file headers in order as bytes come in, so members can be
+decompressed (and loaded) while the rest of the archive is still downloading.
+The central directory at the end of the file is never needed.
+
+Example:
+    for member in iter_zip_members(response.iter_content(1024 * 1024)):
+        if member.name.endswith("ratings.csv"):
+            with member.open() as f:
+                header = f.readline()
+"""
+
+import io
+import zlib
+import struct
+
+LOCAL_FILE_HEADER = b'PK\x03\x04'
+DATA_DESCRIPTOR = b'PK\x07\x08'
+# sig, version, flags, method, mod time, mod date, crc32, compressed size, size, name length, extra length
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+
+FLAG_ENCRYPTED = 0x0001
+FLAG_DATA_DESCRIPTOR = 0x0008
+FLAG_UTF8 = 0x0800
+
+STORED = 0
+DEFLATED = 8
+
+READ_BYTES = 1024 * 1024
+
+
+class _ChunkReader:
+    """Byte reader over an iterator of chunks, with peek and push-back."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def _fill(self, size):
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return False
+            self.buffer += chunk
+        return True
+
+    def peek(self, size):
+        self._fill(size)
+        return bytes(self.buffer[:size])
+
+    def read_exact(self, size):
+        if not self._fill(size):
+            raise ValueError("Zip stream ended in the middle of a member")
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_some(self, limit=READ_BYTES):
+        """Return up to `limit` bytes, or b'' at the end of the stream."""
+        if not self.buffer:
+            self._fill(1)
+        data = bytes(self.buffer[:limit])
+        del self.buffer[:limit]
+        return data
+
+    def unread(self, data):
+        self.buffer[:0] = data
+
+
+def _zip64_sizes(extra, compressed_size, file_size):
+    """Take the real sizes from a zip64 extra field when the header holds 0xFFFFFFFF."""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, length = struct.unpack_from('<HH', extra, position)
+        if field_id == ZIP64_EXTRA_ID:
+            values = iter(struct.unpack_from(f'<{length // 8}Q', extra, position + 4))
+            if file_size == ZIP64_LIMIT:
+                file_size = next(values)
+            if compressed_size == ZIP64_LIMIT:
+                compressed_size = next(values)
+            return compressed_size, file_size, True
+        position += 4 + length
+    return compressed_size, file_size, False
+
+
+class ZipMember:
+    """
+    One member of a streamed archive. Its data can only be read once, before
+    moving on to the next member.
+
+    Attributes:
+        name: Path of the member inside the archive
+        file_size: Uncompressed size, or None when it only follows the data
+        compressed_size: Compressed size, or None when it only follows the data
+    """
+
+    def __init__(self, name, file_size, compressed_size, chunks):
+        self.name = name
+        self.file_size = file_size
+        self.compressed_size = compressed_size
+        self._chunks = chunks
+
+    def __iter__(self):
+        """Yield the decompressed data in chunks."""
+        return self._chunks
+
+    def open(self, buffer_size=READ_BYTES):
+        """Return the decompressed data as a forward-only binary file object."""
+        return io.BufferedReader(_ChunkStream(self._chunks), buffer_size=buffer_size)
+
+    def drain(self):
+        """Read (and check) whatever the caller left unread, to get to the next member."""
+        for _ in self._chunks:
+            pass
+
+
+class _ChunkStream(io.RawIOBase):
+    """Raw, non-seekable file over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.pending = b''
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b''
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        self.position += size
+        return size
+
+
+def _member_chunks(reader, name, method, crc, compressed_size, file_size, has_descriptor, zip64):
+    """Yield the decompressed data of the member at the reader's position and verify it."""
+    checksum = 0
+    produced = 0
+    if method == STORED:
+        remaining = compressed_size
+        while remaining:
+            data = reader.read_some(min(remaining, READ_BYTES))
+            if not data:
+                raise ValueError(f"Zip stream ended in the middle of {name}")
+            remaining -= len(data)
+            checksum = zlib.crc32(data, checksum)
+            produced += len(data)
+            yield data
+    else:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        remaining = None if has_descriptor else compressed_size
+        while not decompressor.eof:
+            data = reader.read_some(READ_BYTES if remaining is None else min(remaining, READ_BYTES))
+            if not data:
+                raise ValueError(f"Zip stream ended in the middle of {name}")
+            if remaining is not None:
+                remaining -= len(data)
+            output = decompressor.decompress(data)
+            if output:
+                checksum = zlib.crc32(output, checksum)
+                produced += len(output)
+                yield output
+        # The compressed data ended inside the last read, give back what follows it
+        reader.unread(decompressor.unused_data)
+        if remaining:
+            reader.read_exact(remaining)
+
+    if has_descriptor:
+        if reader.peek(4) == DATA_DESCRIPTOR:
+            reader.read_exact(4)
+        size_format = '<QQ' if zip64 else '<II'
+        crc = struct.unpack('<I', reader.read_exact(4))[0]
+        _, file_size = struct.unpack(size_format, reader.read_exact(struct.calcsize(size_format)))
+    if checksum != crc or produced != file_size:
+        raise ValueError(f"Corrupt zip member {name}: CRC or size mismatch")
+
+
+def iter_zip_members(chunks):
+    """
+    Yield the members of a ZIP archive from an iterator of byte chunks, in archive order.
+
+    Supports stored and deflated members, zip64 sizes and data descriptors (sizes
+    written after the data). Each member's data must be read, or is skipped,
+    before the next one is yielded; CRC32 and sizes are verified.
+
+    Args:
+        chunks: Iterator of bytes, e.g. requests' response.iter_content()
+
+    Yields:
+        ZipMember
+    """
+    reader = _ChunkReader(chunks)
+    while reader.peek(4) == LOCAL_FILE_HEADER:
+        (_, _, flags, method, _, _, crc, compressed_size, file_size,
+         name_length, extra_length) = LOCAL_HEADER.unpack(reader.read_exact(LOCAL_HEADER.size))
+        name = reader.read_exact(name_length).decode('utf-8' if flags & FLAG_UTF8 else 'cp437')
+        extra = reader.read_exact(extra_length)
+        compressed_size, file_size, zip64 = _zip64_sizes(extra, compressed_size, file_size)
+
+        if flags & FLAG_ENCRYPTED:
+            raise ValueError(f"Encrypted zip member {name} is not supported")
+        if method not in (STORED, DEFLATED):
+            raise ValueError(f"Zip member {name} uses unsupported compression method {method}")
+        has_descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if has_descriptor and method == STORED:
+            raise ValueError(f"Stored zip member {name} without sizes can't be streamed")
+
+        member = ZipMember(name, None if has_descriptor else file_size,
+                           None if has_descriptor else compressed_size,
+                           _member_chunks(reader, name, method, crc, compressed_size, file_size,
+                                          has_descriptor, zip64))
+        yield member
+        member.drain()
@@ -5,13 +5,22 @@ Task 3: Clean/transform staging tables
 
 import os
 import sys
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, text
 from datetime import datetime
 
 # Add parent directory to path so we can import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config.config import DATABASE_URL, LOGS_PATH
+from config.config import (
+    DATABASE_URL, LOGS_PATH, TRANSFORM_INCREMENTAL, DEDUP_STRATEGY, DEDUP_FALLBACK, TRANSFORM_WORKERS
+)
+from progress import ProgressReporter
+from load_staging import (
+    ensure_watermark_table, get_watermark, save_watermark, table_exists, ensure_ledger_table,
+    complete_ledger_blocks, unique_key_proven, ledger_profile
+)
 
 # Setup logging
 logging.basicConfig(
@@ -36,6 +45,32 @@ def create_engine_connection():
         raise
 
 
+# Release year and title without it, in SQL. movie_titles.parse_titles() gives the same in pandas.
+RELEASE_YEAR_SQL = """
+    CASE
+        WHEN title ~ '\\(\\d{4}\\)$'
+        THEN CAST(SUBSTRING(title FROM '\\(([0-9]{4})\\)$') AS INTEGER)
+        ELSE NULL
+    END"""
+CLEAN_TITLE_SQL = """
+    CASE
+        WHEN title ~ '\\(\\d{4}\\)$'
+        THEN TRIM(REGEXP_REPLACE(title, '\\s*\\([0-9]{4}\\)$', ''))
+        ELSE TRIM(title)
+    END"""
+
+
+def staging_titles_parsed(conn):
+    """True if staging_movies has the release_year and clean_title columns the loader adds."""
+    return conn.execute(text("""
+        SELECT COUNT(*) = 2
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'staging_movies'
+          AND column_name IN ('release_year', 'clean_title')
+    """)).scalar()
+
+
 def clean_movies_table(engine):
     """
     Clean the staging_movies table.
@@ -71,21 +106,19 @@ def clean_movies_table(engine):
                 DROP TABLE IF EXISTS cleaned_movies
             """))
             
-            conn.execute(text("""
+            # The loader parses titles as it streams movies.csv in (see movie_titles.py),
+            # tables loaded before that get them parsed here
+            if staging_titles_parsed(conn):
+                logger.info("Using release_year and clean_title parsed at load time")
+                title_columns = "release_year, clean_title"
+            else:
+                title_columns = f"{RELEASE_YEAR_SQL} as release_year, {CLEAN_TITLE_SQL} as clean_title"
+            conn.execute(text(f"""
                 CREATE TABLE cleaned_movies AS
                 SELECT DISTINCT
                     "movieId",
                     TRIM(title) as title,
-                    CASE 
-                        WHEN title ~ '\\(\\d{4}\\)$' 
-                        THEN CAST(SUBSTRING(title FROM '\\(([0-9]{4})\\)$') AS INTEGER)
-                        ELSE NULL 
-                    END as release_year,
-                    CASE 
-                        WHEN title ~ '\\(\\d{4}\\)$' 
-                        THEN TRIM(REGEXP_REPLACE(title, '\\s*\\([0-9]{4}\\)$', ''))
-                        ELSE TRIM(title)
-                    END as clean_title,
+                    {title_columns},
                     COALESCE(TRIM(genres), 'Unknown') as genres
                 FROM staging_movies
                 WHERE "movieId" IS NOT NULL
@@ -104,67 +137,461 @@ def clean_movies_table(engine):
         raise
 
 
-def clean_ratings_table(engine):
+# Rows of staging_ratings kept in cleaned_ratings (NULLs and out-of-range ratings are dropped)
+VALID_RATING = """
+    "userId" IS NOT NULL
+    AND "movieId" IS NOT NULL
+    AND rating IS NOT NULL
+    AND rating >= 0.5
+    AND rating <= 5.0
+"""
+
+# Ways to keep the latest rating of each (userId, movieId) among the rows of {source}
+# matching {where}. Between two ratings with the same timestamp all of them keep the
+# higher one, so they build the same table. Each entry is (SELECT, settings applied
+# with SET LOCAL while it runs).
+DEDUP_STRATEGIES = {
+    # One sort of every row by key and timestamp
+    "distinct_on": ("""
+        SELECT DISTINCT ON ("userId", "movieId")
+            "userId",
+            "movieId",
+            rating,
+            timestamp as rating_timestamp,
+            TO_TIMESTAMP(timestamp) as rating_datetime
+        FROM {source}
+        WHERE {where}
+        ORDER BY "userId", "movieId", timestamp DESC, rating DESC
+    """, {}),
+    # Rank within each key and keep the first
+    "window": ("""
+        SELECT
+            "userId",
+            "movieId",
+            rating,
+            rating_timestamp,
+            TO_TIMESTAMP(rating_timestamp) as rating_datetime
+        FROM (
+            SELECT
+                "userId",
+                "movieId",
+                rating,
+                timestamp as rating_timestamp,
+                ROW_NUMBER() OVER (PARTITION BY "userId", "movieId" ORDER BY timestamp DESC, rating DESC) as rn
+            FROM {source}
+            WHERE {where}
+        ) ranked
+        WHERE rn = 1
+    """, {}),
+    # Hash aggregate without a sort: max() of [timestamp, rating] is the latest rating,
+    # and the higher one on a tie (float8 holds both exactly)
+    "hash_aggregate": ("""
+        SELECT
+            "userId",
+            "movieId",
+            latest[2]::real as rating,
+            latest[1]::bigint as rating_timestamp,
+            TO_TIMESTAMP(latest[1]) as rating_datetime
+        FROM (
+            SELECT "userId", "movieId", MAX(ARRAY[timestamp::float8, rating::float8]) as latest
+            FROM {source}
+            WHERE {where}
+            GROUP BY "userId", "movieId"
+        ) latest
+    """, {"enable_sort": "off"}),
+    # No deduplication, only correct when the keys are already unique
+    "none": ("""
+        SELECT
+            "userId",
+            "movieId",
+            rating,
+            timestamp as rating_timestamp,
+            TO_TIMESTAMP(timestamp) as rating_datetime
+        FROM {source}
+        WHERE {where}
+    """, {}),
+}
+# "skip_if_unique" uses "none" when the load ledger proves staging_ratings has no
+# duplicate keys, and DEDUP_FALLBACK otherwise
+DEDUP_STRATEGY_NAMES = (*DEDUP_STRATEGIES, "skip_if_unique")
+
+
+# Statistics logged about the staging ratings, named like load_staging.profile_block()'s
+# counters, for when they weren't captured at load (or for an incremental delta)
+RATINGS_PROFILE = f"""
+    COUNT(*) as "rows",
+    COUNT(*) FILTER (WHERE "userId" IS NULL) as "null_userId",
+    COUNT(*) FILTER (WHERE "movieId" IS NULL) as "null_movieId",
+    COUNT(*) FILTER (WHERE rating IS NULL) as null_rating,
+    COUNT(*) FILTER (WHERE rating < 0.5 OR rating > 5.0) as invalid_rating,
+    COUNT(*) FILTER (WHERE {VALID_RATING}) as valid,
+    MAX(timestamp) as max_timestamp
+"""
+
+
+# (userId, movieId) pairs with more than one row among all the rows of {source}
+DUPLICATE_PAIRS = """
+    SELECT COUNT(*) FROM (
+        SELECT 1 FROM {source} GROUP BY "userId", "movieId" HAVING COUNT(*) > 1
+    ) pairs
+"""
+
+
+class LateRatingsError(Exception):
+    """Raised when appended staging ratings are not all past the cleaned_ratings watermark."""
+
+
+def staging_heap_bytes(conn):
+    """
+    Size of the staging_ratings heap. Rows appended later are stored past it (the
+    last page may take a few more), which is where merge_ratings_delta() reads them.
+    """
+    return conn.execute(text("SELECT pg_relation_size('staging_ratings')")).scalar()
+
+
+def resolve_dedup_strategy(strategy=DEDUP_STRATEGY, proven_unique=False, fallback=DEDUP_FALLBACK):
+    """Turn the configured strategy into one of DEDUP_STRATEGIES ("none" for skip_if_unique on proven-unique keys)."""
+    if strategy not in DEDUP_STRATEGY_NAMES:
+        raise ValueError(f"Unknown DEDUP_STRATEGY {strategy!r}, expected one of {DEDUP_STRATEGY_NAMES}")
+    if strategy != "skip_if_unique":
+        return strategy
+    return "none" if proven_unique else fallback
+
+
+def apply_dedup_settings(conn, strategy):
+    """SET LOCAL the planner settings of a strategy (call inside its transaction)."""
+    for name, value in DEDUP_STRATEGIES[strategy][1].items():
+        conn.execute(text(f"SET LOCAL {name} = '{value}'"))
+
+
+def dedup_ratings_sql(strategy, where=VALID_RATING, source="staging_ratings"):
+    """SELECT of the deduplicated ratings of `source` matching `where`, using one of DEDUP_STRATEGIES."""
+    return DEDUP_STRATEGIES[strategy][0].format(where=where, source=source)
+
+
+def profile_staging_ratings(engine):
+    """
+    Get the statistics of staging_ratings recorded in the load ledger, and whether its keys are proven unique.
+    
+    Reads no table data. When the ledger doesn't cover the whole table the
+    profile is None, and the build computes it, see build_ratings_sql().
+    
+    Returns:
+        (profile dict with RATINGS_PROFILE's names or None, keys proven unique)
+    """
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        ensure_ledger_table(cursor)
+        blocks = complete_ledger_blocks(cursor, "staging_ratings")
+        proven = blocks is not None and unique_key_proven(cursor, "staging_ratings", blocks)
+        profile = ledger_profile(cursor, "staging_ratings", blocks) if blocks is not None else None
+    if profile is not None:
+        logger.info("Using the staging_ratings statistics recorded while loading it")
+    return profile, proven
+
+
+def build_ratings_sql(table, strategy, where="TRUE"):
+    """
+    One statement that reads the staging rows matching `where` once, inserts their
+    deduplicated ratings into `table` (None = only profile them) and returns their
+    RATINGS_PROFILE, duplicate_pairs (DUPLICATE_PAIRS) and the rows built.
+    
+    The rows go into a MATERIALIZED CTE that the build, the profile and the
+    duplicate count all read, as in merge_ratings_delta(). It spills to temp
+    files, but measured faster than reading staging_ratings again for the
+    profile (see benchmark_transform.py --profile-build).
+    """
+    build = ""
+    built = "0"
+    if table is not None:
+        build = f""",
+        built AS (
+            INSERT INTO {table} ("userId", "movieId", rating, rating_timestamp, rating_datetime)
+            {dedup_ratings_sql(strategy, source="source")}
+            RETURNING 1
+        )"""
+        built = "(SELECT COUNT(*) FROM built)"
+    return f"""
+        WITH source AS MATERIALIZED (
+            SELECT * FROM staging_ratings WHERE {where}
+        ){build}
+        SELECT
+            {built} as built,
+            ({DUPLICATE_PAIRS.format(source="source")}) as duplicate_pairs,
+            profile.*
+        FROM (SELECT {RATINGS_PROFILE} FROM source) profile
+    """
+
+
+def sum_profiles(profiles):
+    """Add up the profiles (build_ratings_sql() results) of disjoint sets of staging rows."""
+    total = {}
+    for profile in profiles:
+        for name, value in profile.items():
+            if name == "max_timestamp":
+                values = [v for v in (total.get(name), value) if v is not None]
+                total[name] = max(values) if values else None
+            else:
+                total[name] = total.get(name, 0) + value
+    return total
+
+
+def log_ratings_profile(profile, label="Ratings"):
+    logger.info(f"{label} - Total: {profile['rows']:,}, NULL userId: {profile['null_userId']}, "
+                f"NULL movieId: {profile['null_movieId']}, NULL rating: {profile['null_rating']}, "
+                f"Invalid rating: {profile['invalid_rating']}")
+
+
+def userid_boundaries(engine, partitions):
+    """
+    Split points dividing the staging userIds into `partitions` ranges of about equal row counts.
+    
+    Taken from the equi-depth histogram ANALYZE keeps in pg_stats (the loader
+    analyzes staging_ratings), falling back to equal-width ranges between the
+    smallest and largest userId.
+    
+    Returns:
+        Strictly increasing list of at most partitions - 1 userIds
+    """
+    with engine.connect() as conn:
+        bounds = conn.execute(text("""
+            SELECT histogram_bounds::text::int[] FROM pg_stats
+            WHERE schemaname = current_schema() AND tablename = 'staging_ratings' AND attname = 'userId'
+        """)).scalar()
+        if bounds:
+            splits = [bounds[round(i * (len(bounds) - 1) / partitions)] for i in range(1, partitions)]
+        else:
+            logger.info("No statistics on staging_ratings.userId, splitting its range evenly")
+            low, high = conn.execute(text('SELECT MIN("userId"), MAX("userId") FROM staging_ratings')).fetchone()
+            if low is None:
+                return []
+            splits = [low + (high - low + 1) * i // partitions for i in range(1, partitions)]
+    return sorted(set(split for split in splits if split is not None))
+
+
+def userid_range(low, high):
+    """WHERE condition for low <= userId < high (None = unbounded), matching a range partition's constraint."""
+    conditions = ['"userId" IS NOT NULL']
+    if low is not None:
+        conditions.append(f'"userId" >= {low}')
+    if high is not None:
+        conditions.append(f'"userId" < {high}')
+    return " AND ".join(conditions)
+
+
+def build_ratings_partition(engine, name, low, high, strategy, primary_key, profiled=False):
+    """
+    Build the cleaned ratings of low <= userId < high as table `name`, in its own transaction.
+    
+    The range is also added as a CHECK constraint (and the primary key, if
+    wanted), so attaching the table as a partition needs no validation scan.
+    With profiled=True the range's staging rows are profiled by the same
+    statement, see build_ratings_sql().
+    
+    Returns:
+        The range's profile (with "built" rows) if profiled, else {"built": rows}
+    """
+    start = time.perf_counter()
+    condition = userid_range(low, high)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        apply_dedup_settings(conn, strategy)
+        if profiled:
+            conn.execute(text(f"CREATE TABLE {name} AS {dedup_ratings_sql(strategy)} WITH NO DATA"))
+            profile = dict(conn.execute(text(build_ratings_sql(name, strategy, condition))).mappings().one())
+        else:
+            profile = {"built": conn.execute(text(f"""
+                CREATE TABLE {name} AS
+                {dedup_ratings_sql(strategy, f"{condition} AND {VALID_RATING}")}
+            """)).rowcount}
+        rows = profile["built"]
+        conn.execute(text(f"ALTER TABLE {name} ADD CONSTRAINT {name}_range CHECK ({condition})"))
+        if primary_key:
+            conn.execute(text(f'ALTER TABLE {name} ADD PRIMARY KEY ("userId", "movieId")'))
+    logger.info(f"Built {name} (userId {low if low is not None else '-inf'} to "
+                f"{high if high is not None else 'inf'}): {rows:,} rows in {time.perf_counter() - start:.2f}s")
+    return profile
+
+
+def profile_null_userids(engine):
+    """Profile the staging rows with a NULL userId, which belong to no partition."""
+    with engine.connect() as conn:
+        return dict(conn.execute(text(build_ratings_sql(None, None, '"userId" IS NULL'))).mappings().one())
+
+
+def _drop_tables_matching(conn, pattern):
+    """Drop every table of the current schema whose name matches a regular expression."""
+    names = conn.execute(text("""
+        SELECT tablename FROM pg_tables
+        WHERE schemaname = current_schema() AND tablename ~ :pattern
+    """), {"pattern": pattern}).scalars().all()
+    for name in names:
+        conn.execute(text(f"DROP TABLE {name}"))
+
+
+def build_partitioned_ratings(engine, strategy, workers, primary_key, profiled=False):
+    """
+    Build the partitions of a cleaned_ratings partitioned by userId range, one per connection.
+    
+    Deduplication is per (userId, movieId), so each partition only needs the
+    staging rows of its own users and the result is the same as a serial build.
+    The partitions are built concurrently as plain tables named
+    cleaned_ratings_new_p<i>, each over its own connection, while the current
+    cleaned_ratings stays readable; attach_ratings_partitions() then swaps them
+    in as the partitions of a new cleaned_ratings.
+    
+    With profiled=True each partition's build also profiles its staging rows,
+    and the rows with a NULL userId are profiled alongside.
+    
+    Returns:
+        (names of the partition tables, their (low, high) userId ranges,
+        profile of all staging rows or None)
+    """
+    splits = userid_boundaries(engine, workers)
+    ranges = list(zip([None] + splits, splits + [None]))
+    names = [f"cleaned_ratings_new_p{i}" for i in range(len(ranges))]
+    connections = min(workers, len(ranges))
+    logger.info(f"Building cleaned_ratings as {len(ranges)} userId range partitions "
+                f"on {connections} connections (splits at {splits})")
+    
+    with engine.begin() as conn:
+        # Partitions left behind by an earlier build that failed before attaching them
+        _drop_tables_matching(conn, '^cleaned_ratings_new_p[0-9]+$')
+    
+    # One pooled connection per thread, so no build waits out the default pool's checkout timeout
+    build_engine = create_engine(engine.url, pool_size=connections, max_overflow=0)
+    try:
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="transform") as pool:
+            futures = [pool.submit(build_ratings_partition, build_engine, name, low, high, strategy,
+                                   primary_key, profiled)
+                       for name, (low, high) in zip(names, ranges)]
+            if profiled:
+                futures.append(pool.submit(profile_null_userids, build_engine))
+            profiles = [future.result() for future in futures]
+    finally:
+        build_engine.dispose()
+    return names, ranges, sum_profiles(profiles) if profiled else None
+
+
+def attach_ratings_partitions(conn, names, ranges, primary_key):
+    """
+    Replace cleaned_ratings with a partitioned table made of the tables build_partitioned_ratings() built.
+    
+    Run in one transaction, so readers see the old cleaned_ratings until it commits.
+    The tables are renamed cleaned_ratings_p<i> (with their constraint and primary key).
+    """
+    conn.execute(text("DROP TABLE IF EXISTS cleaned_ratings"))
+    # Partitions of earlier builds went with their parent, but not ones that were never attached
+    _drop_tables_matching(conn, '^cleaned_ratings_p[0-9]+$')
+    renamed = []
+    for i, name in enumerate(names):
+        final = f"cleaned_ratings_p{i}"
+        conn.execute(text(f"ALTER TABLE {name} RENAME TO {final}"))
+        conn.execute(text(f"ALTER TABLE {final} RENAME CONSTRAINT {name}_range TO {final}_range"))
+        if primary_key:
+            conn.execute(text(f"ALTER INDEX {name}_pkey RENAME TO {final}_pkey"))
+        renamed.append(final)
+    
+    key = ', PRIMARY KEY ("userId", "movieId")' if primary_key else ""
+    conn.execute(text(f"""
+        CREATE TABLE cleaned_ratings (LIKE {renamed[0]}{key}) PARTITION BY RANGE ("userId")
+    """))
+    for name, (low, high) in zip(renamed, ranges):
+        conn.execute(text(f"""
+            ALTER TABLE cleaned_ratings ATTACH PARTITION {name}
+            FOR VALUES FROM ({low if low is not None else 'MINVALUE'}) TO ({high if high is not None else 'MAXVALUE'})
+        """))
+
+
+def clean_ratings_table(engine, incremental=TRANSFORM_INCREMENTAL, strategy=DEDUP_STRATEGY,
+                        workers=TRANSFORM_WORKERS):
     """
     Clean the staging_ratings table.
+    
+    Duplicate ratings are removed with one of DEDUP_STRATEGIES (or none at all
+    with "skip_if_unique" when the loader proved there are none). The NULL,
+    range and duplicate-pair statistics come from the load ledger when it
+    proves the keys unique, and are otherwise computed by the build statement
+    itself, so staging_ratings is read once, by the build.
+    
+    With workers > 1, cleaned_ratings is partitioned by userId range and the
+    partitions are built concurrently, see build_partitioned_ratings().
+    
+    With incremental=True, cleaned_ratings keeps a watermark (the staging row
+    count, heap size and max timestamp it was built from) and later runs only
+    merge the staging rows past it, see merge_ratings_delta(). It is rebuilt in full when
+    there is no usable watermark.
     """
     try:
+        if incremental:
+            delta = find_ratings_delta(engine)
+            if delta is not None:
+                # The delta is deduplicated like a rebuild, but the ledger only proves anything about full loads
+                merge_strategy = DEDUP_FALLBACK if strategy == "skip_if_unique" else strategy
+                try:
+                    return merge_ratings_delta(engine, *delta, strategy=merge_strategy)
+                except LateRatingsError as e:
+                    logger.info(f"{e}, rebuilding cleaned_ratings in full")
+        
         logger.info("Cleaning staging_ratings table...")
+        profile, proven = profile_staging_ratings(engine)
+        # Without proven keys the duplicate pairs have to be counted, and without a load
+        # profile so does the rest: both by the build statement
+        profiled = profile is None or not proven
+        if not profiled:
+            profile['duplicate_pairs'] = 0
+        strategy = resolve_dedup_strategy(strategy, proven)
+        logger.info(f"Deduplicating ratings with strategy {strategy!r}")
         
-        with engine.connect() as conn:
-            # Check for NULL values and invalid ratings
-            result = conn.execute(text("""
-                SELECT 
-                    COUNT(*) as total_rows,
-                    SUM(CASE WHEN "userId" IS NULL THEN 1 ELSE 0 END) as null_userid,
-                    SUM(CASE WHEN "movieId" IS NULL THEN 1 ELSE 0 END) as null_movieid,
-                    SUM(CASE WHEN rating IS NULL THEN 1 ELSE 0 END) as null_rating,
-                    SUM(CASE WHEN rating < 0.5 OR rating > 5.0 THEN 1 ELSE 0 END) as invalid_rating
-                FROM staging_ratings
-            """))
-            row = result.fetchone()
-            logger.info(f"Ratings - Total: {row[0]:,}, NULL userId: {row[1]}, NULL movieId: {row[2]}, NULL rating: {row[3]}, Invalid rating: {row[4]}")
-            
-            # Check for duplicate ratings
-            result = conn.execute(text("""
-                SELECT COUNT(*) as dup_count FROM (
-                    SELECT "userId", "movieId", COUNT(*) 
-                    FROM staging_ratings 
-                    GROUP BY "userId", "movieId" 
-                    HAVING COUNT(*) > 1
-                ) subq
-            """))
-            duplicates = result.scalar()
-            logger.info(f"Ratings - User-Movie duplicate pairs: {duplicates}")
+        if workers > 1:
+            names, ranges, built_profile = build_partitioned_ratings(engine, strategy, workers,
+                                                                     primary_key=incremental, profiled=profiled)
         
         # Use begin() for transactions that modify data
         with engine.begin() as conn:
-            conn.execute(text("""
-                DROP TABLE IF EXISTS cleaned_ratings
-            """))
+            if workers > 1:
+                attach_ratings_partitions(conn, names, ranges, primary_key=incremental)
+            else:
+                conn.execute(text("""
+                    DROP TABLE IF EXISTS cleaned_ratings
+                """))
+                
+                apply_dedup_settings(conn, strategy)
+                if profiled:
+                    conn.execute(text(f"CREATE TABLE cleaned_ratings AS {dedup_ratings_sql(strategy)} WITH NO DATA"))
+                    built_profile = dict(conn.execute(text(build_ratings_sql("cleaned_ratings", strategy)))
+                                         .mappings().one())
+                else:
+                    conn.execute(text(f"""
+                        CREATE TABLE cleaned_ratings AS
+                        {dedup_ratings_sql(strategy)}
+                    """))
+                
+                if incremental:
+                    # The key later merges upsert on
+                    conn.execute(text("""
+                        ALTER TABLE cleaned_ratings ADD PRIMARY KEY ("userId", "movieId")
+                    """))
             
-            conn.execute(text("""
-                CREATE TABLE cleaned_ratings AS
-                SELECT DISTINCT ON ("userId", "movieId")
-                    "userId",
-                    "movieId",
-                    rating,
-                    timestamp as rating_timestamp,
-                    TO_TIMESTAMP(timestamp) as rating_datetime
-                FROM staging_ratings
-                WHERE "userId" IS NOT NULL 
-                    AND "movieId" IS NOT NULL
-                    AND rating IS NOT NULL
-                    AND rating >= 0.5 
-                    AND rating <= 5.0
-                ORDER BY "userId", "movieId", timestamp DESC
-            """))
+            if profiled:
+                profile = built_profile
+            if incremental:
+                cursor = conn.connection.cursor()
+                ensure_watermark_table(cursor)
+                save_watermark(cursor, "cleaned_ratings", "staging_ratings", staging_heap_bytes(conn), "",
+                               profile['rows'], max_timestamp=profile['max_timestamp'])
         
         # Verify cleaned table
         with engine.connect() as conn:
             result = conn.execute(text("SELECT COUNT(*) FROM cleaned_ratings"))
             count = result.scalar()
             logger.info(f"Created cleaned_ratings table with {count:,} rows")
+        
+        log_ratings_profile(profile)
+        if not profiled:
+            logger.info("Ratings - User-Movie duplicate pairs: 0 (keys proven unique at load)")
+        else:
+            logger.info(f"Ratings - User-Movie duplicate pairs: {profile['duplicate_pairs']}")
             
         return count
             
@@ -173,6 +600,119 @@ def clean_ratings_table(engine):
         raise
 
 
+def find_ratings_delta(engine):
+    """
+    Decide whether cleaned_ratings can be brought up to date incrementally.
+    
+    The watermark of cleaned_ratings is removed whenever staging_ratings is
+    rebuilt, so while it exists staging_ratings has only been appended to, by
+    the difference between its watermark's row count and the one recorded
+    for cleaned_ratings. Reads no table data.
+    
+    Returns:
+        (watermark timestamp, staging heap size in bytes at the watermark,
+        staging row count, rows appended since), or None for a full rebuild
+    """
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        ensure_watermark_table(cursor)
+        watermark = get_watermark(cursor, "cleaned_ratings")
+        if watermark is None or watermark['max_timestamp'] is None:
+            logger.info("No watermark for cleaned_ratings, rebuilding it in full")
+            return None
+        if not table_exists(cursor, "cleaned_ratings"):
+            logger.info("cleaned_ratings is missing, rebuilding it in full")
+            return None
+        
+        # Without a staging watermark staging_ratings isn't loaded incrementally, and
+        # hasn't been reloaded since cleaned_ratings was built either
+        staging = get_watermark(cursor, "staging_ratings")
+        staging_rows = staging['total_rows'] if staging is not None else watermark['total_rows']
+    
+    appended = staging_rows - watermark['total_rows']
+    if appended < 0:
+        logger.info("staging_ratings shrank below the cleaned_ratings watermark, rebuilding it in full")
+        return None
+    logger.info(f"cleaned_ratings watermark: {watermark['total_rows']:,} staging rows up to timestamp "
+                f"{watermark['max_timestamp']}, {appended:,} appended since")
+    return watermark['max_timestamp'], watermark['byte_offset'], staging_rows, appended
+
+
+def merge_ratings_delta(engine, watermark_timestamp, heap_bytes, staging_rows, appended, strategy=DEDUP_FALLBACK):
+    """
+    Upsert the staging ratings past the watermark into cleaned_ratings.
+    
+    Within the delta the latest rating of each (userId, movieId) wins, picked
+    with one of DEDUP_STRATEGIES as in a full rebuild, and replaces the stored
+    one only if it is newer. One statement reads the delta once, upserts it
+    and profiles it; the upsert and the new watermark are committed together.
+    
+    staging_ratings is only appended to, so the delta is read with a TID range
+    scan of the heap from the last page it had at the watermark (heap_bytes):
+    the cost scales with the new rows, not the table.
+    
+    Raises:
+        LateRatingsError: if the rows past the watermark aren't exactly the
+            `appended` ones (some arrived with older timestamps, or were stored
+            in free space earlier in the heap); nothing is changed
+    
+    Returns:
+        Row count of cleaned_ratings
+    """
+    if appended == 0:
+        logger.info("No new staging ratings, cleaned_ratings is up to date")
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM cleaned_ratings")).scalar()
+    
+    logger.info(f"Merging {appended:,} new staging ratings into cleaned_ratings...")
+    with engine.begin() as conn:
+        apply_dedup_settings(conn, strategy)
+        result = conn.execute(text(f"""
+            WITH delta AS MATERIALIZED (
+                SELECT * FROM staging_ratings
+                WHERE ctid >= format('(%s,0)',
+                                     GREATEST(:heap_bytes / current_setting('block_size')::bigint - 1, 0))::tid
+                  AND timestamp > :watermark
+            ),
+            upserted AS (
+                INSERT INTO cleaned_ratings ("userId", "movieId", rating, rating_timestamp, rating_datetime)
+                {dedup_ratings_sql(strategy, source="delta")}
+                ON CONFLICT ("userId", "movieId") DO UPDATE SET
+                    rating = EXCLUDED.rating,
+                    rating_timestamp = EXCLUDED.rating_timestamp,
+                    rating_datetime = EXCLUDED.rating_datetime
+                WHERE EXCLUDED.rating_timestamp > cleaned_ratings.rating_timestamp
+                RETURNING "userId", "movieId"
+            )
+            SELECT
+                (SELECT COUNT(*) FROM upserted) as upserted,
+                -- The statement reads cleaned_ratings as it was before the upsert, so the
+                -- upserted keys found in it are the updated ones (xmax can't tell them
+                -- apart on a partitioned cleaned_ratings)
+                (SELECT COUNT(*) FROM upserted JOIN cleaned_ratings USING ("userId", "movieId")) as updated,
+                profile.*
+            FROM (SELECT {RATINGS_PROFILE} FROM delta) profile
+        """), {'watermark': watermark_timestamp, 'heap_bytes': heap_bytes})
+        profile = dict(result.mappings().one())
+        if profile['rows'] != appended:
+            # Raising rolls the upsert back
+            raise LateRatingsError(f"{appended:,} staging rows were appended but {profile['rows']:,} are past "
+                                   f"the cleaned_ratings watermark (timestamp {watermark_timestamp}, "
+                                   f"heap byte {heap_bytes:,})")
+        
+        cursor = conn.connection.cursor()
+        save_watermark(cursor, "cleaned_ratings", "staging_ratings", staging_heap_bytes(conn), "", staging_rows,
+                       max_timestamp=profile['max_timestamp'])
+    log_ratings_profile(profile, "Ratings delta")
+    logger.info(f"Ratings - Inserted {profile['upserted'] - profile['updated']:,} new user-movie pairs, "
+                f"updated {profile['updated']:,}")
+    
+    with engine.connect() as conn:
+        count = conn.execute(text("SELECT COUNT(*) FROM cleaned_ratings")).scalar()
+    logger.info(f"cleaned_ratings now has {count:,} rows")
+    return count
+
+
 def show_sample_data(engine):
     """Show sample data from cleaned tables."""
     try:
@@ -209,15 +749,19 @@ def main():
     start_time = datetime.now()
     
     engine = create_engine_connection()
+    progress = ProgressReporter(3, label="Task 3", unit="steps")
     
     logger.info("-" * 30)
     movies_count = clean_movies_table(engine)
+    progress.advance(detail="cleaned_movies built")
     
     logger.info("-" * 30)
     ratings_count = clean_ratings_table(engine)
+    progress.advance(detail="cleaned_ratings built")
     
     logger.info("-" * 30)
     show_sample_data(engine)
+    progress.advance(detail="samples shown")
     
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
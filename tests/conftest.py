@@ -0,0 +1,54 @@
+"""
+Shared fixtures. The scripts are imported the way the DAG runs them, from scripts/.
+
+Tests that need PostgreSQL use the database in TEST_DATABASE_URL (its public
+schema is dropped and recreated, so point it at a throwaway database), or a
+temporary cluster started with pgserver when that is installed, and are
+skipped otherwise.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+sys.path.insert(0, ROOT)
+
+from config.config import LOGS_PATH  # noqa: E402
+
+# The scripts log to LOGS_PATH from the moment they are imported
+os.makedirs(LOGS_PATH, exist_ok=True)
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    url = os.environ.get("TEST_DATABASE_URL")
+    if url:
+        yield url
+        return
+    try:
+        import pgserver
+    except ImportError:
+        pytest.skip("needs PostgreSQL: set TEST_DATABASE_URL or install pgserver")
+    with tempfile.TemporaryDirectory() as pgdata:
+        server = pgserver.get_server(pgdata, cleanup_mode="delete")
+        try:
+            yield server.get_uri()
+        finally:
+            server.cleanup()
+
+
+@pytest.fixture
+def engine(database_url):
+    """Engine on an empty public schema."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    yield engine
+    engine.dispose()
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_data
+from download_data import download_file
+
+CONTENT = bytes(range(256)) * 400
+
+
+class FileServer(ThreadingHTTPServer):
+    """Serves `content` at every path, optionally with Range support and a dropped first response."""
+
+    def __init__(self, content, ranges=True):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.content = content
+        self.etag = '"v1"'
+        self.ranges = ranges
+        self.drop_after = None  # bytes of the next response sent before the connection is closed
+        self.requests = []  # (method, headers, status) of every request
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/data.bin"
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_file_headers(self):
+        content = self.server.content
+        start, end = 0, len(content)
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if self.server.ranges and range_header and if_range in (None, self.server.etag):
+            first, _, last = range_header[len("bytes="):].partition("-")
+            start, end = int(first), int(last) + 1 if last else len(content)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(content)}")
+        else:
+            self.send_response(200)
+        self.server.requests.append((self.command, dict(self.headers), 206 if start or end < len(content) else 200))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        return content[start:end]
+
+    def do_HEAD(self):
+        self.send_file_headers()
+
+    def do_GET(self):
+        body = self.send_file_headers()
+        drop_after, self.server.drop_after = self.server.drop_after, None
+        if drop_after is not None:
+            self.wfile.write(body[:drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(download_data.time, "sleep", lambda seconds: None)
+    server = FileServer(CONTENT)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def download(server, tmp_path, **kwargs):
+    # Chunks smaller than the dropped response, so part of it reaches the file
+    return download_file(server.url, str(tmp_path), "data.bin", chunk_size=1000, **kwargs)
+
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def gets(server):
+    return [(headers.get("Range"), headers.get("If-Range"), status)
+            for method, headers, status in server.requests if method == "GET"]
+
+
+def test_dropped_connection_resumes_with_range(server, tmp_path):
+    server.drop_after = 10000
+    path = download(server, tmp_path, expected_sha256=sha256(CONTENT))
+    assert read(path) == CONTENT
+    assert gets(server) == [(None, None, 200), ("bytes=10000-", '"v1"', 206)]
+    assert download_data.read_sidecar(path)["sha256"] == sha256(CONTENT)
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_changed_file_is_sent_in_full(server, tmp_path):
+    server.drop_after = 10000
+    with pytest.raises(Exception):
+        download(server, tmp_path, retries=0)
+    assert os.path.getsize(tmp_path / "data.bin.part") == 10000
+
+    # If-Range no longer matches, so the resume gets the new file from byte 0
+    changed = CONTENT[::-1]
+    server.content, server.etag = changed, '"v2"'
+    path = download(server, tmp_path, expected_sha256=sha256(changed))
+    assert read(path) == changed
+    assert gets(server)[-1] == ("bytes=10000-", '"v1"', 200)
+
+
+def test_checksum_mismatch(server, tmp_path):
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        download(server, tmp_path, expected_sha256="0" * 64)
+    assert os.listdir(tmp_path) == []
+
+
+def test_server_without_range_support(server, tmp_path):
+    server.ranges = False
+    server.drop_after = 10000
+    path = download(server, tmp_path, expected_sha256=sha256(CONTENT), connections=4)
+    assert read(path) == CONTENT
+    # No segmented download, and the resume gets the whole file again
+    assert gets(server) == [(None, None, 200), ("bytes=10000-", '"v1"', 200)]
+
+
+def test_segmented_download(server, tmp_path):
+    path = download(server, tmp_path, expected_sha256=sha256(CONTENT), connections=4)
+    assert read(path) == CONTENT
+    assert sorted(headers["Range"] for _, headers, _ in server.requests if "Range" in headers) == [
+        "bytes=0-25599", "bytes=25600-51199", "bytes=51200-76799", "bytes=76800-102399"]
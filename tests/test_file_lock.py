@@ -0,0 +1,114 @@
+import json
+import multiprocessing
+import os
+import signal
+import time
+
+import pytest
+
+from file_lock import FileLock, LockLost, LockTimeout
+
+# The lock holders are forked so they share this test's imports (and SIGSTOP is POSIX)
+fork = multiprocessing.get_context("fork")
+
+
+def hold_and_log(path, log_path, hold):
+    with FileLock(path, stale_after=30, poll_interval=0.02):
+        with open(log_path, "a") as log:
+            log.write(f"enter {os.getpid()}\n")
+        time.sleep(hold)
+        with open(log_path, "a") as log:
+            log.write(f"exit {os.getpid()}\n")
+
+
+def hold_and_die(path):
+    FileLock(path, stale_after=30).acquire()
+    os._exit(0)
+
+
+def hold_until_lost(path, acquired, resumed, stale_after):
+    lock = FileLock(path, stale_after=stale_after).acquire()
+    acquired.set()
+    resumed.wait(30)
+    if not lock.lost.wait(10):
+        os._exit(1)
+    try:
+        lock.check()
+    except LockLost:
+        lock.release()
+        os._exit(0)
+    os._exit(2)
+
+
+def test_processes_take_turns(tmp_path):
+    path, log_path = str(tmp_path / "data.lock"), str(tmp_path / "log")
+    holders = [fork.Process(target=hold_and_log, args=(path, log_path, 0.1)) for _ in range(4)]
+    for holder in holders:
+        holder.start()
+    for holder in holders:
+        holder.join(30)
+        assert holder.exitcode == 0
+
+    with open(log_path) as log:
+        events = log.read().split("\n")[:-1]
+    assert len(events) == 8
+    # Every holder leaves before the next one enters
+    for enter, exit in zip(events[::2], events[1::2]):
+        assert enter.split() == ["enter", exit.split()[1]] and exit.startswith("exit")
+    assert not os.path.exists(path)
+
+
+def test_dead_owner_is_detected(tmp_path):
+    path = str(tmp_path / "data.lock")
+    holder = fork.Process(target=hold_and_die, args=(path,))
+    holder.start()
+    holder.join(30)
+    assert os.path.exists(path)
+
+    # Long before stale_after: the owner's pid no longer exists on this host
+    start = time.monotonic()
+    with FileLock(path, timeout=10, stale_after=30, poll_interval=0.02) as lock:
+        assert lock.waited
+    assert time.monotonic() - start < 5
+
+
+def test_stalled_owner_loses_the_lock(tmp_path):
+    path = str(tmp_path / "data.lock")
+    acquired, resumed = fork.Event(), fork.Event()
+    holder = fork.Process(target=hold_until_lost, args=(path, acquired, resumed, 0.5))
+    holder.start()
+    try:
+        assert acquired.wait(30)
+        with open(path) as f:
+            stalled_owner = json.load(f)
+        os.kill(holder.pid, signal.SIGSTOP)
+
+        # Alive but without a heartbeat for stale_after seconds, so the lock is taken over
+        start = time.monotonic()
+        lock = FileLock(path, timeout=10, stale_after=0.5, poll_interval=0.05).acquire()
+        assert lock.waited and time.monotonic() - start >= 0.5
+        with open(path) as f:
+            assert json.load(f)["token"] == lock.owner["token"] != stalled_owner["token"]
+
+        # The stalled owner's heartbeat notices when it resumes, and its release leaves our lock alone
+        os.kill(holder.pid, signal.SIGCONT)
+        resumed.set()
+        holder.join(30)
+        assert holder.exitcode == 0
+        assert not lock.lost.is_set()
+        with open(path) as f:
+            assert json.load(f)["token"] == lock.owner["token"]
+        lock.release()
+        assert not os.path.exists(path)
+    finally:
+        if holder.is_alive():
+            os.kill(holder.pid, signal.SIGCONT)
+            holder.kill()
+
+
+def test_timeout(tmp_path):
+    path = str(tmp_path / "data.lock")
+    with FileLock(path, stale_after=30):
+        blocked = FileLock(path, timeout=0.2, stale_after=30, poll_interval=0.05)
+        with pytest.raises(LockTimeout):
+            blocked.acquire()
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import text
+
+from load_staging import AdaptiveChunkSizer, load_csv_to_staging
+
+RATINGS = [(user, movie, (user + movie) % 10 / 2 + 0.5, 1_000_000_000 + user * 100 + movie)
+           for user in range(1, 601) for movie in range(1, 26)]
+
+
+@pytest.fixture
+def ratings_csv(tmp_path):
+    path = tmp_path / "ratings.csv"
+    lines = ["userId,movieId,rating,timestamp"] + [f"{u},{m},{r:g},{t}" for u, m, r, t in RATINGS]
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def staging_ratings(engine):
+    with engine.connect() as conn:
+        return sorted(tuple(row) for row in conn.execute(text("SELECT * FROM staging_ratings")))
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+@pytest.mark.parametrize("method, parse_engine",
+                         [("copy", "c"), ("copy", "numpy"), ("binary", "c"), ("binary", "numpy")])
+def test_load_ratings(engine, ratings_csv, workers, method, parse_engine):
+    rows = load_csv_to_staging(engine, ratings_csv, "staging_ratings", chunksize=1000, method=method,
+                               workers=workers, table_mode="unlogged", parse_engine=parse_engine, adaptive=False)
+    assert rows == len(RATINGS)
+    assert staging_ratings(engine) == RATINGS
+    with engine.connect() as conn:
+        assert conn.execute(text("""
+            SELECT COUNT(*) FROM staging_load_ledger
+            WHERE table_name = 'staging_ratings' AND completed_at IS NOT NULL
+        """)).scalar() >= workers
+
+
+def test_adaptive_sizer_settles_after_throughput_drops():
+    # rows/sec of each block size, best at 4,000 rows
+    rates = {1000: 100, 2000: 200, 4000: 300, 8000: 250}
+    sizer = AdaptiveChunkSizer(line_bytes=20, min_rows=1000, max_rows=64000)
+    sizes = []
+    for _ in range(10):
+        rows = sizer.rows
+        sizes.append(rows)
+        sizer.observe(rows, rows * 20, rows / rates[rows])
+    assert sizes == [1000, 2000, 4000, 8000] + [4000] * 6
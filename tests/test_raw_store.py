@@ -0,0 +1,43 @@
+import errno
+import hashlib
+import os
+
+import raw_store
+from raw_store import RawStore
+
+
+def add_file(store, tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    store.add(str(path), sha256)
+    os.remove(path)
+    return sha256
+
+
+def test_collect_garbage_keeps_copies_listed_in_manifests(tmp_path, monkeypatch):
+    store = RawStore(str(tmp_path / "store"))
+    kept = add_file(store, tmp_path, "kept.csv", b"kept\n")
+    pruned = add_file(store, tmp_path, "pruned.csv", b"pruned\n")
+
+    def cross_device(source, destination):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    # Runs on another filesystem get copies, so the objects' link count stays 1
+    monkeypatch.setattr(raw_store.os, "link", cross_device)
+    run_dir = str(tmp_path / "runs" / "1")
+    store.link(kept, os.path.join(run_dir, "kept.csv"))
+    store.write_manifest(run_dir, {"kept.csv": kept})
+
+    assert store.collect_garbage(live_dirs=[run_dir]) == (1, len(b"pruned\n"))
+    assert store.has(kept)
+    assert not store.has(pruned)
+
+
+def test_collect_garbage_keeps_hardlinked_objects(tmp_path):
+    store = RawStore(str(tmp_path / "store"))
+    linked = add_file(store, tmp_path, "linked.csv", b"linked\n")
+    store.link(linked, str(tmp_path / "elsewhere" / "linked.csv"))
+
+    assert store.collect_garbage() == (0, 0)
+    assert store.has(linked)
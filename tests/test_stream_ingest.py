@@ -0,0 +1,52 @@
+import hashlib
+import io
+import threading
+import zipfile
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import text
+
+from stream_ingest import ingest_archive
+
+MEMBERS = {"ml-32m/ratings.csv": "staging_ratings"}
+
+
+@pytest.fixture
+def archive_url(tmp_path):
+    ratings = "userId,movieId,rating,timestamp\n" + "".join(f"{user},1,4.0,{1000 + user}\n" for user in range(1, 101))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("ml-32m/ratings.csv", ratings)
+    (tmp_path / "ml-32m.zip").write_bytes(buffer.getvalue())
+
+    handler = partial(SimpleHTTPRequestHandler, directory=str(tmp_path))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/ml-32m.zip", hashlib.sha256(buffer.getvalue()).hexdigest()
+    server.shutdown()
+    server.server_close()
+
+
+def staging_state(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT COUNT(*) FROM staging_ratings")).scalar()
+        watermarks = conn.execute(text("SELECT COUNT(*) FROM staging_watermarks")).scalar()
+        blocks = conn.execute(text("SELECT COUNT(*) FROM staging_load_ledger")).scalar()
+    return rows, watermarks, blocks
+
+
+def test_ingest_archive(engine, archive_url):
+    url, sha256 = archive_url
+    assert ingest_archive(engine, url, members=MEMBERS, expected_sha256=sha256) == {"staging_ratings": 100}
+    assert staging_state(engine) == (100, 0, 0)
+
+
+def test_checksum_mismatch_empties_staging(engine, archive_url):
+    url, _ = archive_url
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        ingest_archive(engine, url, members=MEMBERS, expected_sha256="0" * 64)
+    assert staging_state(engine) == (0, 0, 0)
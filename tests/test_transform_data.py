@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+
+from load_staging import create_staging_table, ensure_watermark_table, save_watermark
+from transform_data import clean_ratings_table
+
+
+def append_staging_ratings(engine, rows, create=False):
+    """Add rows to staging_ratings and move its watermark, like an incremental load."""
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            if create:
+                create_staging_table(cursor, "staging_ratings")
+            cursor.executemany('INSERT INTO staging_ratings VALUES (%s, %s, %s, %s)', rows)
+            cursor.execute("ANALYZE staging_ratings")
+            cursor.execute("SELECT COUNT(*) FROM staging_ratings")
+            total_rows = cursor.fetchone()[0]
+            ensure_watermark_table(cursor)
+            save_watermark(cursor, "staging_ratings", "ratings.csv", 0, "", total_rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def cleaned_ratings(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text('SELECT "userId", "movieId", rating, rating_timestamp FROM cleaned_ratings'))
+        return {(user, movie): (rating, timestamp) for user, movie, rating, timestamp in rows}
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_merge_after_build(engine, workers, caplog):
+    initial = [(user, movie, 3.0, 1000 + user) for user in range(1, 31) for movie in range(1, 5)]
+    initial.append((1, 1, 4.5, 2000))  # duplicate pair, the later rating wins
+    append_staging_ratings(engine, initial, create=True)
+
+    assert clean_ratings_table(engine, incremental=True, strategy="distinct_on", workers=workers) == 120
+    with engine.connect() as conn:
+        partitioned = conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE relname = 'cleaned_ratings'"))
+        assert partitioned.scalar() == (workers > 1)
+
+    # One new pair, one newer rating of a stored pair
+    append_staging_ratings(engine, [(31, 1, 5.0, 3000), (2, 2, 1.0, 3001)])
+    with caplog.at_level(logging.INFO):
+        count = clean_ratings_table(engine, incremental=True, strategy="distinct_on", workers=workers)
+    assert "Inserted 1 new user-movie pairs, updated 1" in caplog.text
+    assert count == 121
+
+    expected = {(user, movie): (3.0, 1000 + user) for user in range(1, 31) for movie in range(1, 5)}
+    expected.update({(1, 1): (4.5, 2000), (31, 1): (5.0, 3000), (2, 2): (1.0, 3001)})
+    assert cleaned_ratings(engine) == expected
+
+
+@pytest.mark.parametrize("strategy", ["distinct_on", "window", "hash_aggregate"])
+def test_strategies_keep_the_higher_rating_on_a_tie(engine, strategy):
+    append_staging_ratings(engine, [(1, 1, 2.0, 100), (1, 1, 4.0, 100), (1, 1, 5.0, 99), (2, 1, 3.0, 100)],
+                           create=True)
+    clean_ratings_table(engine, incremental=False, strategy=strategy, workers=1)
+    assert cleaned_ratings(engine) == {(1, 1): (4.0, 100), (2, 1): (3.0, 100)}
+
+
+def test_late_ratings_rebuild(engine, caplog):
+    append_staging_ratings(engine, [(user, 1, 3.0, 1000 + user) for user in range(1, 11)], create=True)
+    clean_ratings_table(engine, incremental=True, strategy="distinct_on", workers=1)
+
+    # Older than the watermark, so a merge would miss it
+    append_staging_ratings(engine, [(11, 1, 4.0, 500)])
+    with caplog.at_level(logging.INFO):
+        assert clean_ratings_table(engine, incremental=True, strategy="distinct_on", workers=1) == 11
+    assert "rebuilding cleaned_ratings in full" in caplog.text
+    assert cleaned_ratings(engine)[(11, 1)] == (4.0, 500)